@@ -9,5 +9,11 @@ python manage.py collectstatic --noinput
 
 python manage.py migrate
 
-# Load initial product and category data
-python manage.py loaddata shop/fixtures/initial_data.json
+# Load initial product and category data (only into an empty catalogue)
+python manage.py seed_catalogue
+
+# Apply any promotions that are currently running
+python manage.py apply_promotions
+
+# Shared catalogue snapshot for gunicorn workers
+python manage.py build_catalogue_snapshot
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings, read automatically from the working directory.
+
+preload_app loads (and warms up, see shop/warmup.py) the application once in
+the master, so workers fork already warm and share the imported code and
+compiled templates copy-on-write. Database connections opened during warm-up
+are closed before each fork and reopened in the new worker.
+"""
+
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        from django.conf import settings
+        from django.db import connections
+        connections.close_all()
+        if settings.DB_POOL:
+            # close_all() only returned them to the master's pool
+            from shop.dbpool import close_pools
+            close_pools()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from django.conf import settings
+        if settings.WARMUP_ON_START:
+            from shop.warmup import connect_databases
+            try:
+                connect_databases()
+            except Exception:
+                server.log.exception('Worker %s could not connect to the database', worker.pid)
@@ -27,15 +27,20 @@ INSTALLED_APPS = [
 
     'shop.cart',
     'shop.orders',
+    'shop.wishlist',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'shop.middleware.LoadSheddingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.ReplicaPinningMiddleware',
+    'shop.middleware.RateLimitMiddleware',
+    'shop.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,6 +81,53 @@ else:
         }
     }
 
+# Read replicas for catalogue browsing, e.g.
+# DATABASE_REPLICA_URLS=postgres://replica1/db,postgres://replica2/db
+# Locally, two SQLite files work too: DATABASE_REPLICA_URLS=sqlite:///db_replica.sqlite3
+REPLICA_DATABASES = []
+for i, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    alias = f'replica{i + 1}'
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=600)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['shop.routers.PrimaryReplicaRouter']
+
+# DB_POOL=True borrows PostgreSQL connections from a bounded pool per worker
+# process (see shop/dbpool) instead of keeping one open per thread
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+if DB_POOL:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.postgresql':
+            database['ENGINE'] = 'shop.dbpool'
+            database['CONN_MAX_AGE'] = 0
+            database['POOL'] = {
+                'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+                'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', '5')),
+                'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+                'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', '1')),
+            }
+
+# /metrics answers only requests from METRICS_ALLOWED_IPS (the connecting
+# address, not a forwarded header) or with 'Authorization: Bearer <METRICS_TOKEN>'
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Shared cache (catalogue versions, facet counts, rate-limit buckets).
+# Without REDIS_URL each process uses its own in-memory cache.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# How long a session keeps reading from the primary after it writes
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -106,15 +158,95 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 WHITENOISE_MANIFEST_STRICT = False
 
+# CSS bundles built from shop/assets/css by `manage.py build_assets` (see
+# shop/bundles.py). The critical bundle is inlined into every page, the rest
+# preloaded; ASSETS_INLINE_ALL inlines everything, as pages used to.
+ASSET_SOURCE_DIR = BASE_DIR / 'shop' / 'assets' / 'css'
+ASSET_OUTPUT_DIR = BASE_DIR / 'shop' / 'static'
+ASSET_BUNDLES = {
+    'shop/dist/critical.css': ['critical.css', 'sidebar.css', 'products.css'],
+    'shop/dist/site.css': ['footer.css'],
+}
+ASSETS_INLINE_ALL = os.environ.get('ASSETS_INLINE_ALL', 'False') == 'True'
+
+# Absolute base URL used in sitemaps and product feeds
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+
+# Shared read-only catalogue built by `manage.py build_catalogue_snapshot`;
+# views fall back to the ORM when it is missing, older than MAX_AGE seconds
+# or no longer matches the database (checked every CHECK_INTERVAL seconds).
+CATALOGUE_SNAPSHOT_PATH = os.environ.get('CATALOGUE_SNAPSHOT_PATH', str(BASE_DIR / 'catalogue.snapshot'))
+CATALOGUE_SNAPSHOT_MAX_AGE = int(os.environ.get('CATALOGUE_SNAPSHOT_MAX_AGE', '3600'))
+CATALOGUE_SNAPSHOT_CHECK_INTERVAL = 30
+
+# Output of `manage.py generate_feeds`
+FEEDS_ROOT = os.environ.get('FEEDS_ROOT', BASE_DIR / 'feeds')
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CART_SESSION_ID = 'cart'
+WISHLIST_SESSION_ID = 'wishlist'
+
+SESSION_SERIALIZER = 'shop.cart.serializers.JSONSerializer'
+
+# Sampling profiler: staff requests with an `X-Profile: 1` header are always
+# profiled; PROFILER_SAMPLE_RATE profiles a random fraction of all requests.
+PROFILER_HEADER = 'X-Profile'
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', '0'))
+PROFILER_INTERVAL_MS = 5
+PROFILER_VIEW_MODULES = ['shop.views', 'shop.cart.views', 'shop.orders.views']
+PROFILER_DIR = os.environ.get('PROFILER_DIR', BASE_DIR / 'profiles')
+PROFILER_MAX_FILES = int(os.environ.get('PROFILER_MAX_FILES', '50'))
+
+# Token buckets per URL name for POSTs (see shop/ratelimit.py): 'N/m' allows
+# bursts of N and N per minute sustained, per client IP and per session.
+RATE_LIMITS = {
+    'cart:cart_add': {'ip': '120/m', 'session': '30/m'},
+    'cart:cart_remove': {'ip': '120/m', 'session': '30/m'},
+    'orders:order_create': {'ip': '30/m', 'session': '10/m'},
+    'wishlist:wishlist_add': {'ip': '120/m', 'session': '30/m'},
+    'orders:order_lookup': {'ip': '10/m', 'session': '5/m'},
+}
+# Header holding the real client IP behind the proxy (nginx sets X-Real-IP)
+RATE_LIMIT_IP_HEADER = os.environ.get('RATE_LIMIT_IP_HEADER', '')
+
+# Load shedding: when LOAD_SHED_MAX_IN_FLIGHT requests are in flight across
+# all workers (0 disables; counted in Redis, so set REDIS_URL), browse
+# requests are refused above BROWSE_FRACTION of it and cart/checkout
+# requests only at the full limit. Requests older than REQUEST_TIMEOUT
+# seconds (gunicorn's timeout) no longer count.
+LOAD_SHED_MAX_IN_FLIGHT = int(os.environ.get('LOAD_SHED_MAX_IN_FLIGHT', '0'))
+LOAD_SHED_REQUEST_TIMEOUT = 120
+LOAD_SHED_BROWSE_FRACTION = 0.75
+LOAD_SHED_PRIORITY_NAMESPACES = ['cart', 'orders']
+# Never shed: health checks and scrapes must reach busy but healthy workers
+LOAD_SHED_EXEMPT_URL_NAMES = ['readyz', 'metrics']
+LOAD_SHED_RETRY_AFTER = 5
+
+# Send the product list's shell at once and its product cards in chunks of
+# STREAM_CHUNK_SIZE as they render (see shop/streaming.py)
+STREAM_PRODUCT_LIST = os.environ.get('STREAM_PRODUCT_LIST', 'True') == 'True'
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '24'))
+
+# Warm URLs, templates, caches and DB connections when wsgi.py is loaded;
+# /readyz fails until this has finished (see shop/warmup.py)
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'True') == 'True'
+
+# Confirmation emails are sent by background workers (manage.py run_workers)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'orders@ipswich-retail.com')
+
+# Lifetime of signed guest links to an order page and to an email's order history
+ORDER_TOKEN_MAX_AGE = int(os.environ.get('ORDER_TOKEN_MAX_AGE', str(90 * 24 * 60 * 60)))
+ORDER_HISTORY_LINK_MAX_AGE = int(os.environ.get('ORDER_HISTORY_LINK_MAX_AGE', str(24 * 60 * 60)))
 
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
+    # Health checks probe the container directly over plain HTTP
+    SECURE_REDIRECT_EXEMPT = [r'^readyz$', r'^metrics$']
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
     SECURE_BROWSER_XSS_FILTER = True
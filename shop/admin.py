@@ -1,21 +1,37 @@
 from django.contrib import admin
-from .models import Category, Product, Order, OrderItem
+from django.utils import timezone
+from .models import AbandonedCart, Category, Product, Order, OrderItem, Job, ArchivedOrder, Promotion, WishlistItem
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug']
+    list_display = ['name', 'slug', 'parent', 'path']
+    list_filter = ['parent']
+    ordering = ['path']
     prepopulated_fields = {'slug': ('name',)}
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'price', 'stock', 'available', 'created', 'updated']
+    list_display = ['name', 'slug', 'price', 'effective_price', 'stock', 'available', 'created', 'updated']
     list_filter = ['available', 'created', 'updated']
     list_editable = ['price', 'stock', 'available']
     prepopulated_fields = {'slug': ('name',)}
 
 
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'kind', 'value', 'product', 'category', 'starts_at', 'ends_at', 'active']
+    list_filter = ['active', 'kind', 'category']
+    raw_id_fields = ['product']
+
+
+@admin.register(WishlistItem)
+class WishlistItemAdmin(admin.ModelAdmin):
+    list_display = ['product', 'user', 'session_key', 'notified_price', 'notified_in_stock', 'created_at']
+    raw_id_fields = ['user', 'product']
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     raw_id_fields = ['product']
@@ -24,7 +40,45 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'status', 'created_at']
-    list_filter = ['status', 'created_at', 'updated_at']
+    list_display = ['id', 'first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'status', 'claimed_by', 'created_at']
+    list_filter = ['status', 'claimed_by', 'created_at', 'updated_at']
     list_editable = ['status']
+    raw_id_fields = ['user']
     inlines = [OrderItemInline]
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['order_id', 'email', 'status', 'total_price', 'created_at', 'archived_at']
+    list_filter = ['status']
+    search_fields = ['email']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AbandonedCart)
+class AbandonedCartAdmin(admin.ModelAdmin):
+    list_display = ['id', 'expired_at', 'total_price']
+    date_hierarchy = 'expired_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'updated_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['last_error', 'locked_by', 'locked_at', 'created_at', 'updated_at']
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs')
+    def retry_jobs(self, request, queryset):
+        queryset.exclude(status='running').update(status='queued', attempts=0, run_at=timezone.now())
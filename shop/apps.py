@@ -1,5 +1,6 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.utils.module_loading import autodiscover_modules
 
 def create_superuser(sender, **kwargs):
     from django.contrib.auth import get_user_model
@@ -15,3 +16,21 @@ class ShopConfig(AppConfig):
     def ready(self):
         
         post_migrate.connect(create_superuser, sender=self)
+        from .catalogue import bump_catalogue_version
+        for model in (self.get_model('Category'), self.get_model('Product')):
+            post_save.connect(bump_catalogue_version, sender=model)
+            post_delete.connect(bump_catalogue_version, sender=model)
+        from .storage import release_image_reference, remember_old_image, update_image_references
+        product = self.get_model('Product')
+        pre_save.connect(remember_old_image, sender=product)
+        post_save.connect(update_image_references, sender=product)
+        post_delete.connect(release_image_reference, sender=product)
+        from .promotions import reprice_catalogue, reprice_product
+        post_save.connect(reprice_product, sender=product)
+        post_save.connect(reprice_catalogue, sender=self.get_model('Promotion'))
+        post_delete.connect(reprice_catalogue, sender=self.get_model('Promotion'))
+        from django.contrib.auth.signals import user_logged_in
+        from .wishlist.wishlist import merge_session_wishlist
+        user_logged_in.connect(merge_session_wishlist)
+        # Register background job handlers defined in each app's tasks.py
+        autodiscover_modules('tasks')
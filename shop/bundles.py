@@ -0,0 +1,85 @@
+"""
+Static CSS bundles.
+
+The stylesheets for the shop's own templates live as plain sources in
+shop/assets/css. `manage.py build_assets` concatenates and minifies them into
+the bundles listed in settings.ASSET_BUNDLES under shop/static, where
+collectstatic picks them up like any other static file: the
+CompressedManifestStaticFilesStorage gives each one a content-hashed name
+(so it can be cached forever) and writes .gz and .br copies that WhiteNoise
+serves without compressing per request.
+
+The 'critical' bundle - everything needed to paint the navbar, headings,
+messages, sidebar and product card grid - is small enough to inline into
+every page; the rest is
+preloaded and applied without blocking the first paint. See
+templatetags/shop_assets.py.
+"""
+
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+COMMENTS = re.compile(r'/\*.*?\*/', re.S)
+SPACE_AROUND = re.compile(r'\s*([{};,>])\s*')
+SPACE_AFTER_COLON = re.compile(r':\s+')
+
+
+def minify_css(text):
+    text = COMMENTS.sub('', text)
+    text = ' '.join(text.split())
+    text = SPACE_AROUND.sub(r'\1', text)
+    text = SPACE_AFTER_COLON.sub(':', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def render_bundle(name):
+    sources = settings.ASSET_BUNDLES[name]
+    return ''.join(minify_css((settings.ASSET_SOURCE_DIR / source).read_text()) for source in sources)
+
+
+def build_bundles(check=False):
+    """
+    Write every bundle under ASSET_OUTPUT_DIR. Returns the names of bundles
+    that changed; with check=True nothing is written.
+    """
+    changed = []
+    for name in settings.ASSET_BUNDLES:
+        target = settings.ASSET_OUTPUT_DIR / name
+        content = render_bundle(name)
+        if target.exists() and target.read_text() == content:
+            continue
+        changed.append(name)
+        if not check:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content)
+    return changed
+
+
+@lru_cache(maxsize=None)
+def _read_bundle(name):
+    path = finders.find(name)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    with staticfiles_storage.open(name) as f:
+        return f.read().decode('utf-8')
+
+
+def read_bundle(name):
+    """Contents of a built bundle, for inlining; cached unless DEBUG."""
+    if settings.DEBUG:
+        _read_bundle.cache_clear()
+    return _read_bundle(name)
+
+
+def bundle_url(name):
+    try:
+        return staticfiles_storage.url(name)
+    except ValueError:
+        # Not collected yet (tests, a fresh checkout): fall back to the
+        # unhashed name, as with WHITENOISE_MANIFEST_STRICT = False
+        return settings.STATIC_URL + name
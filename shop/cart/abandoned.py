@@ -0,0 +1,75 @@
+"""
+Deleting expired sessions in small batches, optionally keeping their carts.
+
+Django's clearsessions is one DELETE of every expired row, which on a large
+session table holds locks and produces a burst of dead rows for minutes.
+purge_batch() deletes one keyset-ordered batch, by primary key, in its own
+short transaction; `manage.py purge_sessions` calls it in a loop. The
+anonymous wishlist rows of each deleted session go with it: nothing can
+reach them once the session holding their key is gone.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Q
+
+from shop.models import AbandonedCart, WishlistItem
+
+from .cart import from_pence, to_pence
+
+
+def expired_sessions(now, after=None):
+    """Expired sessions in (expire_date, session_key) order, after the `after` row."""
+    sessions = Session.objects.filter(expire_date__lt=now)
+    if after:
+        expire_date, session_key = after
+        sessions = sessions.filter(
+            Q(expire_date__gt=expire_date) | Q(expire_date=expire_date, session_key__gt=session_key)
+        )
+    return sessions.order_by('expire_date', 'session_key')
+
+
+def abandoned_cart(session, expired_at):
+    """An unsaved AbandonedCart for a (decoded) session's cart, or None if it had none."""
+    data = session.get(settings.CART_SESSION_ID)
+    if isinstance(data, dict):
+        # Legacy {'id': {'quantity': n, 'price': '9.99'}} carts
+        data = [n for pid, item in data.items()
+                for n in (int(pid), item['quantity'], to_pence(Decimal(item['price'])))]
+    if not data:
+        return None
+    items, pence = [], 0
+    for i in range(0, len(data), 3):
+        items += data[i:i + 2]
+        pence += data[i + 1] * data[i + 2]
+    return AbandonedCart(expired_at=expired_at, items=items, total_price=from_pence(pence))
+
+
+def purge_batch(now, after=None, batch_size=1000, keep_carts=False):
+    """
+    Delete one batch of expired sessions and their anonymous wishlists,
+    saving their carts first if keep_carts. Returns (sessions deleted, carts
+    kept, last (expire_date, session_key)), or (0, 0, None) when none are left.
+    """
+    rows = list(expired_sessions(now, after).values_list('expire_date', 'session_key', 'session_data')[:batch_size])
+    if not rows:
+        return 0, 0, None
+    store = SessionStore()
+    sessions = [(expired_at, store.decode(data)) for expired_at, _, data in rows]
+    wishlist_keys = [session[settings.WISHLIST_SESSION_ID] for _, session in sessions
+                     if session.get(settings.WISHLIST_SESSION_ID)]
+    carts = []
+    if keep_carts:
+        carts = [cart for cart in (abandoned_cart(session, expired_at) for expired_at, session in sessions) if cart]
+    with transaction.atomic():
+        AbandonedCart.objects.bulk_create(carts)
+        if wishlist_keys:
+            WishlistItem.objects.filter(user=None, session_key__in=wishlist_keys).delete()
+        # Expired sessions are never loaded or saved again, so nothing can
+        # have changed since they were read
+        deleted, _ = Session.objects.filter(session_key__in=[row[1] for row in rows]).delete()
+    return deleted, len(carts), rows[-1][:2]
@@ -2,50 +2,88 @@ from decimal import Decimal
 from django.conf import settings
 from shop.models import Product
 
+
+def to_pence(price):
+    return int(price * 100)
+
+
+def from_pence(pence):
+    return Decimal(pence).scaleb(-2)
+
+
 class Cart(object):
+    """
+    Session cart. Stored in the session as a flat list of integers
+    [product_id, quantity, price_in_pence, ...] to keep session payloads
+    small; in memory it is a dict of product_id -> [quantity, pence].
+    """
+
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        data = self.session.get(settings.CART_SESSION_ID)
+        if isinstance(data, dict):
+            # Carts saved before the compact format: {'id': {'quantity': n, 'price': '9.99'}}
+            self.cart = {int(pid): [item['quantity'], to_pence(Decimal(item['price']))] for pid, item in data.items()}
+        else:
+            data = data or []
+            self.cart = {data[i]: [data[i + 1], data[i + 2]] for i in range(0, len(data), 3)}
 
     def add(self, product, quantity=1, update_quantity=False):
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': 0, 'price': str(product.price)}
+        line = self.cart.setdefault(product.id, [0, to_pence(product.effective_price)])
         if update_quantity:
-            self.cart[product_id]['quantity'] = quantity
+            line[0] = quantity
         else:
-            self.cart[product_id]['quantity'] += quantity
+            line[0] += quantity
         self.save()
 
     def save(self):
+        self.session[settings.CART_SESSION_ID] = [n for pid, line in self.cart.items() for n in (pid, *line)]
         self.session.modified = True
 
     def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
+        if product.id in self.cart:
+            del self.cart[product.id]
+            self.save()
+
+    def revalidate(self):
+        """
+        Re-price the cart against the catalogue in one query, dropping
+        products that are no longer available. Returns the ids of
+        products whose price changed or that were removed.
+        """
+        current = dict(
+            Product.objects.filter(id__in=self.cart.keys(), available=True).values_list('id', 'effective_price')
+        )
+        changed = []
+        for pid, line in list(self.cart.items()):
+            if pid not in current:
+                del self.cart[pid]
+                changed.append(pid)
+            elif to_pence(current[pid]) != line[1]:
+                line[1] = to_pence(current[pid])
+                changed.append(pid)
+        if changed:
             self.save()
+        return changed
 
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
+        products = Product.objects.filter(id__in=self.cart.keys())
         for product in products:
-            cart[str(product.id)]['product'] = product
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+            quantity, pence = self.cart[product.id]
+            yield {
+                'product': product,
+                'quantity': quantity,
+                'price': from_pence(pence),
+                'total_price': from_pence(pence * quantity),
+            }
 
     def __len__(self):
-        return sum(item['quantity'] for item in self.cart.values())
+        return sum(line[0] for line in self.cart.values())
 
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return from_pence(sum(quantity * pence for quantity, pence in self.cart.values()))
 
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
+        self.cart = {}
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.session.modified = True
@@ -26,8 +26,10 @@ def cart_remove(request, product_id):
 
 def cart_detail(request):
     cart = Cart(request)
-    for item in cart:
+    # Iterating the cart builds fresh item dicts, so build them once
+    items = list(cart)
+    for item in items:
         item['update_quantity_form'] = CartAddProductForm(
             initial={'quantity': item['quantity'], 'override': True}
         )
-    return render(request, 'shop/cart/detail.html', {'cart': cart})
+    return render(request, 'shop/cart/detail.html', {'cart': cart, 'items': items})
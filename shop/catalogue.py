@@ -0,0 +1,149 @@
+"""
+Catalogue-wide helpers: a cache version that changes whenever a Category or
+Product is saved or deleted, the category tree, and facet counts for the
+product list sidebar.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, Q, Value, When
+
+from .models import Category, Product
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+
+FACET_CACHE_SECONDS = 60 * 60
+# Without Redis each process has its own cache, and a save in another
+# process (an admin worker, the promotions scheduler) cannot bump this
+# process's version, so facets may only be this stale
+LOCAL_FACET_CACHE_SECONDS = 30
+
+PRICE_BUCKETS = [
+    (Decimal('0'), Decimal('25')),
+    (Decimal('25'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('250')),
+    (Decimal('250'), Decimal('500')),
+    (Decimal('500'), None),
+]
+
+
+def get_catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, 1, None)
+        version = cache.get(CATALOGUE_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalogue_version(**kwargs):
+    """Signal receiver: invalidate everything cached against the catalogue."""
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+def category_tree(categories):
+    """
+    Arrange a flat list of categories (from catalogue_categories()) into a
+    tree using their materialised paths. Returns them depth-first with
+    siblings sorted by name, each with .child_nodes set.
+    """
+    by_path = {c.path: c for c in categories}
+    roots = []
+    for c in categories:
+        c.child_nodes = []
+    for c in sorted(categories, key=lambda c: c.name):
+        parent = by_path.get(c.path[:-Category.PATH_STEP])
+        (parent.child_nodes if parent else roots).append(c)
+
+    ordered = []
+
+    def visit(nodes):
+        for node in nodes:
+            ordered.append(node)
+            visit(node.child_nodes)
+    visit(roots)
+    return ordered
+
+
+def count_subtrees(tree, counts):
+    """Set .product_count on each node of category_tree() output to its subtree total."""
+    for node in reversed(tree):
+        node.product_count = counts.get(node.id, 0) + sum(child.product_count for child in node.child_nodes)
+
+
+def subtree_ids(categories, category):
+    return {c.id for c in categories if c.path.startswith(category.path)}
+
+
+def ancestors(categories, category):
+    """Breadcrumb trail from the root down to `category`'s parent."""
+    by_path = {c.path: c for c in categories}
+    step = Category.PATH_STEP
+    return [by_path[category.path[:i]] for i in range(step, len(category.path), step) if category.path[:i] in by_path]
+
+
+def bucket_label(low, high):
+    if high is None:
+        return f'£{low:.0f}+'
+    return f'£{low:.0f} – £{high:.0f}'
+
+
+def price_bucket():
+    whens = [When(effective_price__lt=high, then=Value(i))
+             for i, (low, high) in enumerate(PRICE_BUCKETS) if high is not None]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1))
+
+
+def price_filter(min_price=None, max_price=None):
+    q = Q()
+    if min_price is not None:
+        q &= Q(effective_price__gte=min_price)
+    if max_price is not None:
+        q &= Q(effective_price__lt=max_price)
+    return q
+
+
+def facet_counts(category_ids=None, min_price=None, max_price=None, in_stock=False):
+    """
+    Product counts per category and per price bucket under the current filter.
+
+    Uses one grouped query over (category, price bucket). Category counts apply
+    the price filter but not the category filter, and bucket counts apply the
+    category filter (`category_ids`, e.g. a subtree) but not the price filter,
+    so each facet shows what selecting it would return. Category counts are
+    per category; count_subtrees() rolls them up the tree. Results are cached
+    per catalogue version, briefly when the cache is not shared.
+    """
+    key = f'facets:{get_catalogue_version()}:{int(in_stock)}:{min_price}:{max_price}'
+    rows = cache.get(key)
+    if rows is None:
+        products = Product.objects.filter(available=True)
+        if in_stock:
+            products = products.filter(stock__gt=0)
+        rows = list(
+            products.order_by()
+            .annotate(bucket=price_bucket())
+            .values('category_id', 'bucket')
+            .annotate(count=Count('id'), in_range=Count('id', filter=price_filter(min_price, max_price)))
+        )
+        cache.set(key, rows, FACET_CACHE_SECONDS if settings.REDIS_URL else LOCAL_FACET_CACHE_SECONDS)
+
+    categories = {}
+    buckets = [0] * len(PRICE_BUCKETS)
+    for row in rows:
+        categories[row['category_id']] = categories.get(row['category_id'], 0) + row['in_range']
+        if category_ids is None or row['category_id'] in category_ids:
+            buckets[row['bucket']] += row['count']
+    return {
+        'categories': categories,
+        'total': sum(categories.values()),
+        'price_buckets': [
+            {'min': low, 'max': high, 'label': bucket_label(low, high), 'count': count}
+            for (low, high), count in zip(PRICE_BUCKETS, buckets)
+        ],
+    }
@@ -0,0 +1,240 @@
+"""
+Process-wide PostgreSQL connection pool.
+
+With conn_max_age every gunicorn worker thread keeps its own connection open
+between requests: one idle server connection per thread, no cap across a
+worker's threads, and after a database failover each thread finds out its
+connection is dead by failing a request. The 'shop.dbpool' database engine
+(enabled with DB_POOL=True, see settings.py) instead borrows connections
+from one bounded pool per process and database alias:
+
+- at most MAX_SIZE connections are open; a request that finds them all in
+  use waits up to TIMEOUT seconds, then fails with OperationalError;
+- MIN_SIZE connections are opened when the pool is created (at warm-up);
+- a connection that has been idle for more than CHECK_AFTER seconds is
+  checked with SELECT 1 when it is borrowed; if the check fails it is
+  discarded together with every other idle connection (after a failover
+  they are all dead) and a fresh one is used;
+- connections older than MAX_LIFETIME seconds are closed instead of reused,
+  so connections are rebalanced after the database is restarted or resized.
+
+Django returns the connection to the pool when it would otherwise close it,
+i.e. at the end of each request (CONN_MAX_AGE is 0 with the pool). Counters
+for /metrics come from pool_stats().
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, max_lifetime=1800.0, check_after=1.0):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._cond = threading.Condition()
+        # (connection, returned_at), most recently returned last
+        self._idle = deque()
+        self._opened_at = {}
+        self.size = 0
+        self.waiting = 0
+        self.stats = dict.fromkeys([
+            'opened', 'closed', 'acquired', 'waits', 'timeouts', 'failed_checks', 'wait_seconds', 'connect_seconds',
+        ], 0)
+
+    def _open(self):
+        started = time.monotonic()
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._cond:
+                self.size -= 1
+                self._cond.notify()
+            raise
+        now = time.monotonic()
+        with self._cond:
+            self._opened_at[id(conn)] = now
+            self.stats['opened'] += 1
+            self.stats['connect_seconds'] += now - started
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection and free its slot; call without the lock held."""
+        with self._cond:
+            self._opened_at.pop(id(conn), None)
+            self.size -= 1
+            self.stats['closed'] += 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn, now):
+        return now - self._opened_at.get(id(conn), now) > self.max_lifetime
+
+    def fill(self):
+        """Open connections until MIN_SIZE are open."""
+        while True:
+            with self._cond:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            conn = self._open()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _check(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            stale = []
+            conn = None
+            with self._cond:
+                while conn is None:
+                    now = time.monotonic()
+                    while self._idle:
+                        candidate, returned_at = self._idle.pop()
+                        if candidate.closed or self._expired(candidate, now):
+                            stale.append(candidate)
+                        else:
+                            conn = candidate
+                            break
+                    if conn is not None or stale:
+                        break
+                    if self.size < self.max_size:
+                        self.size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(f'No database connection free after {self.timeout}s '
+                                          f'({self.max_size} in use)')
+                    self.stats['waits'] += 1
+                    self.waiting += 1
+                    self._cond.wait(remaining)
+                    self.waiting -= 1
+            for candidate in stale:
+                self._discard(candidate)
+            if conn is None and stale:
+                continue  # slots were freed; try again
+            if conn is None:
+                conn = self._open()
+            elif time.monotonic() - returned_at > self.check_after and not self._check(conn):
+                self._failed_check(conn)
+                continue
+            with self._cond:
+                self.stats['acquired'] += 1
+                self.stats['wait_seconds'] += time.monotonic() - started
+            return conn
+
+    def _failed_check(self, conn):
+        with self._cond:
+            self.stats['failed_checks'] += 1
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+        logger.warning('Pooled database connection failed its health check; closing %d connection(s)', len(idle) + 1)
+        for dead in [conn] + idle:
+            self._discard(dead)
+
+    def release(self, conn):
+        if conn.closed or self._expired(conn, time.monotonic()):
+            self._discard(conn)
+            return
+        try:
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """Close every idle connection (connections in use are closed when released)."""
+        with self._cond:
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, size=self.size, idle=len(self._idle), in_use=self.size - len(self._idle),
+                        waiting=self.waiting, max_size=self.max_size)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, connect=None):
+    """The pool for a database alias, created (and filled) on first use."""
+    pool = _pools.get(alias)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is not None:
+            return pool
+        options = settings_dict.get('POOL', {})
+        pool = _pools[alias] = ConnectionPool(
+            connect,
+            min_size=options.get('MIN_SIZE', 1),
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 5.0),
+            max_lifetime=options.get('MAX_LIFETIME', 1800.0),
+            check_after=options.get('CHECK_AFTER', 1.0),
+        )
+    try:
+        pool.fill()
+    except Exception:
+        logger.exception('Could not open the minimum pool of connections to %s', alias)
+    return pool
+
+
+def pool_stats():
+    return {alias: pool.snapshot() for alias, pool in list(_pools.items())}
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+def _forget_pools_after_fork():
+    # Connections inherited from the parent share its sockets: closing them
+    # here would end the parent's sessions, so keep them referenced and unused
+    _inherited.extend(_pools.values())
+    _pools.clear()
+
+
+_inherited = []
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
@@ -0,0 +1,30 @@
+"""
+PostgreSQL backend that borrows connections from shop.dbpool instead of
+opening one per thread. Use with CONN_MAX_AGE = 0, and pool settings under
+the database's 'POOL' key.
+"""
+
+from django.db.backends.postgresql import base
+
+from . import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        parent = super().get_new_connection
+        pool = get_pool(self.alias, self.settings_dict, lambda: parent(conn_params))
+        # The parent sets this while opening a connection; a pooled one may
+        # have been opened by another thread's wrapper
+        self.isolation_level = base.IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', base.IsolationLevel.READ_COMMITTED)
+        )
+        return pool.acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.in_atomic_block:
+            # Django keeps this connection object until the atomic block
+            # exits, so it must not be handed to another thread meanwhile
+            self.connection.close()
+        get_pool(self.alias, self.settings_dict).release(self.connection)
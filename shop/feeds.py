@@ -0,0 +1,189 @@
+"""
+Sitemap and product feed generation (see `manage.py generate_feeds`).
+
+Available products are split into shards by id range (SHARD_SIZE ids per
+shard, the sitemap protocol's 50k URL limit). Each run streams only the
+shards that changed since the previous run - a product in the shard was
+updated, or the shard's product count changed - and rewrites their sitemap
+and feed parts. sitemap.xml is a sitemap index; products.csv/products.xml are
+concatenated from the per-shard parts without touching the database.
+
+Every file is written atomically alongside a gzip copy, which serve_feed
+sends to clients that accept it.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Category, Product
+
+SHARD_SIZE = 50000
+
+STATE_FILE = 'state.json'
+
+FEED_FIELDS = ['id', 'title', 'description', 'link', 'image_link', 'price', 'availability', 'product_type']
+
+STATIC_PAGES = ['shop:home', 'shop:product_list', 'shop:about', 'shop:contact', 'shop:blog']
+
+URLSET_OPEN = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+
+def absolute(path):
+    return settings.SITE_URL.rstrip('/') + path
+
+
+def write_file(path, data):
+    """Atomically write `data` (bytes) and a gzip copy next to it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for target, payload in ((path, data), (path + '.gz', gzip.compress(data, 9))):
+        tmp = target + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, target)
+
+
+def concatenate(path, parts, header=b'', footer=b''):
+    """Join already-written parts into `path` (and its gzip copy) without loading them whole."""
+    with open(path + '.tmp', 'wb') as out, gzip.open(path + '.gz.tmp', 'wb', 9) as out_gz:
+        for target in (out, out_gz):
+            target.write(header)
+        for part in parts:
+            with open(part, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    out.write(chunk)
+                    out_gz.write(chunk)
+        for target in (out, out_gz):
+            target.write(footer)
+    os.replace(path + '.tmp', path)
+    os.replace(path + '.gz.tmp', path + '.gz')
+
+
+def url_entry(loc, lastmod=None):
+    lastmod = f'<lastmod>{lastmod:%Y-%m-%d}</lastmod>' if lastmod else ''
+    return f'<url><loc>{escape(loc)}</loc>{lastmod}</url>\n'
+
+
+def shard_stats():
+    """Product count and latest update per shard, in one grouped query."""
+    rows = (
+        Product.objects.filter(available=True).order_by()
+        .annotate(shard=F('id') / SHARD_SIZE)
+        .values('shard')
+        .annotate(count=Count('id'), updated=Max('updated'))
+    )
+    return {row['shard']: row for row in rows}
+
+
+def write_shard(root, shard):
+    products = (
+        Product.objects.filter(available=True, id__gte=shard * SHARD_SIZE, id__lt=(shard + 1) * SHARD_SIZE)
+        .order_by('id')
+        .values('id', 'slug', 'name', 'description', 'effective_price', 'stock', 'image', 'updated',
+                'category__name')
+    )
+    sitemap = io.StringIO()
+    sitemap.write(URLSET_OPEN)
+    feed_csv = io.StringIO()
+    writer = csv.writer(feed_csv)
+    feed_xml = io.StringIO()
+
+    for p in products.iterator(chunk_size=2000):
+        link = absolute(reverse('shop:product_detail', args=[p['id'], p['slug']]))
+        image = absolute(settings.MEDIA_URL + p['image']) if p['image'] else ''
+        availability = 'in stock' if p['stock'] > 0 else 'out of stock'
+        sitemap.write(url_entry(link, p['updated']))
+        row = [p['id'], p['name'], p['description'], link, image, f"{p['effective_price']} GBP", availability,
+               p['category__name']]
+        writer.writerow(row)
+        feed_xml.write('<item>' + ''.join(
+            f'<g:{field}>{escape(str(value))}</g:{field}>' for field, value in zip(FEED_FIELDS, row)
+        ) + '</item>\n')
+    sitemap.write('</urlset>\n')
+
+    write_file(os.path.join(root, 'sitemaps', f'products-{shard}.xml'), sitemap.getvalue().encode())
+    write_file(os.path.join(root, 'parts', f'products-{shard}.csv'), feed_csv.getvalue().encode())
+    write_file(os.path.join(root, 'parts', f'products-{shard}.xml'), feed_xml.getvalue().encode())
+
+
+def write_static_sitemap(root):
+    urls = [url_entry(absolute(reverse(name))) for name in STATIC_PAGES]
+    urls += [url_entry(absolute(c.get_absolute_url())) for c in Category.objects.all()]
+    write_file(os.path.join(root, 'sitemaps', 'pages.xml'), (URLSET_OPEN + ''.join(urls) + '</urlset>\n').encode())
+
+
+def write_index(root, shards):
+    now = timezone.now()
+    names = ['pages.xml'] + [f'products-{shard}.xml' for shard in shards]
+    entries = ''.join(
+        f'<sitemap><loc>{escape(absolute(reverse("shop:sitemap_part", args=[name])))}</loc>'
+        f'<lastmod>{now:%Y-%m-%d}</lastmod></sitemap>\n'
+        for name in names
+    )
+    write_file(os.path.join(root, 'sitemap.xml'), (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n' + entries + '</sitemapindex>\n'
+    ).encode())
+
+    parts = os.path.join(root, 'parts')
+    concatenate(
+        os.path.join(root, 'products.csv'),
+        [os.path.join(parts, f'products-{shard}.csv') for shard in shards],
+        header=(','.join(FEED_FIELDS) + '\r\n').encode(),
+    )
+    concatenate(
+        os.path.join(root, 'products.xml'),
+        [os.path.join(parts, f'products-{shard}.xml') for shard in shards],
+        header=b'<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">'
+               b'<channel><title>Ipswich Retail</title>\n',
+        footer=b'</channel></rss>\n',
+    )
+
+
+def remove_shard(root, shard):
+    for path in (os.path.join(root, 'sitemaps', f'products-{shard}.xml'),
+                 os.path.join(root, 'parts', f'products-{shard}.csv'),
+                 os.path.join(root, 'parts', f'products-{shard}.xml')):
+        for target in (path, path + '.gz'):
+            if os.path.exists(target):
+                os.remove(target)
+
+
+def generate(root=None, full=False):
+    """Regenerate changed shards; returns (rewritten, total) shard counts."""
+    root = str(root or settings.FEEDS_ROOT)
+    state_path = os.path.join(root, STATE_FILE)
+    state = {}
+    if not full and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    last_run = parse_datetime(state['last_run']) if state.get('last_run') else None
+    previous = {int(k): v for k, v in state.get('shards', {}).items()}
+
+    started = timezone.now()
+    stats = shard_stats()
+    changed = [
+        shard for shard, row in sorted(stats.items())
+        if last_run is None or row['updated'] > last_run or previous.get(shard) != row['count']
+    ]
+    for shard in changed:
+        write_shard(root, shard)
+    for shard in set(previous) - set(stats):
+        remove_shard(root, shard)
+
+    write_static_sitemap(root)
+    write_index(root, sorted(stats))
+
+    state = {'last_run': started.isoformat(), 'shards': {str(k): v['count'] for k, v in stats.items()}}
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+    return len(changed), len(stats)
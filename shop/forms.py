@@ -0,0 +1,22 @@
+from django import forms
+
+SORT_CHOICES = [
+    ('name', 'Name'),
+    ('price', 'Price: low to high'),
+    ('-price', 'Price: high to low'),
+    ('newest', 'Newest'),
+]
+
+SORT_ORDERING = {
+    'name': ('name',),
+    'price': ('effective_price', 'name'),
+    '-price': ('-effective_price', 'name'),
+    'newest': ('-created',),
+}
+
+
+class ProductFilterForm(forms.Form):
+    min_price = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    max_price = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    in_stock = forms.BooleanField(required=False)
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
@@ -0,0 +1,112 @@
+"""
+Lightweight database-backed job queue.
+
+Register a handler with @job('name') in an app's tasks.py, then call
+enqueue('name', key=value, ...) from a view. Jobs are stored in the shop_job
+table and executed by `python manage.py run_workers`.
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it (PostgreSQL); elsewhere (SQLite) each job is claimed with a
+conditional UPDATE, so two workers can never run the same job.
+
+Failed jobs are retried with exponential backoff and marked 'dead' once
+max_attempts is reached. A job whose worker died mid-run counts that run as
+an attempt too, so a job that keeps killing its worker ends up 'dead'
+rather than requeued forever.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_SECONDS = 10
+
+_registry = {}
+
+
+def job(name):
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, delay=None, max_attempts=5, **payload):
+    if name not in _registry:
+        raise KeyError(f'No job handler registered for {name!r}')
+    run_at = timezone.now() + (delay or timedelta())
+    return Job.objects.create(name=name, payload=payload, run_at=run_at, max_attempts=max_attempts)
+
+
+def _due():
+    return Job.objects.filter(status='queued', run_at__lte=timezone.now()).order_by('run_at', 'id')
+
+
+def claim_jobs(worker_id, limit=10):
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_due().select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(status='running', locked_by=worker_id, locked_at=now)
+    else:
+        ids = []
+        for job_id in _due().values_list('id', flat=True)[:limit]:
+            if Job.objects.filter(id=job_id, status='queued').update(
+                    status='running', locked_by=worker_id, locked_at=now):
+                ids.append(job_id)
+    return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def run_job(job_obj):
+    job_obj.attempts += 1
+    try:
+        _registry[job_obj.name](**job_obj.payload)
+    except Exception:
+        job_obj.last_error = traceback.format_exc()
+        if job_obj.attempts >= job_obj.max_attempts:
+            job_obj.status = 'dead'
+            logger.error('Job %s is dead after %d attempts', job_obj, job_obj.attempts)
+        else:
+            job_obj.status = 'queued'
+            job_obj.run_at = timezone.now() + timedelta(seconds=BACKOFF_SECONDS * 2 ** (job_obj.attempts - 1))
+            logger.warning('Job %s failed, retrying at %s', job_obj, job_obj.run_at)
+    else:
+        job_obj.status = 'done'
+        job_obj.last_error = ''
+    job_obj.locked_by = ''
+    job_obj.locked_at = None
+    job_obj.save()
+    return job_obj.status
+
+
+def requeue_stale(older_than):
+    """
+    Return jobs left 'running' by a crashed worker to the queue, counting the
+    crashed run as an attempt. Returns (requeued, dead).
+    """
+    cutoff = timezone.now() - older_than
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    released = {'attempts': F('attempts') + 1, 'locked_by': '', 'locked_at': None}
+    with transaction.atomic():
+        dead = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+            status='dead', last_error='Worker stopped while running the job', **released)
+        requeued = stale.update(status='queued', **released)
+    if dead:
+        logger.error('%d stale job(s) are dead after reaching max_attempts', dead)
+    return requeued, dead
+
+
+def run_pending(worker_id, limit=10):
+    """Claim and run one batch of due jobs; returns the number processed."""
+    jobs = claim_jobs(worker_id, limit)
+    for job_obj in jobs:
+        run_job(job_obj)
+    return len(jobs)
@@ -0,0 +1,45 @@
+"""
+Management command to recompute product effective prices from promotions.
+
+Run once after bulk edits, or with --loop as a long-running scheduler that
+wakes at each promotion start/end so sales switch on and off on time.
+
+Usage:
+    python manage.py apply_promotions
+    python manage.py apply_promotions --loop
+    python manage.py apply_promotions --loop --max-sleep 60
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from shop.promotions import apply_promotions, next_boundary
+
+
+class Command(BaseCommand):
+    help = 'Apply active promotions to Product.effective_price'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, re-applying at every promotion boundary')
+        parser.add_argument('--max-sleep', type=float, default=300,
+                            help='Longest wait between runs in --loop mode, in seconds (default: 300)')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            applied = apply_promotions()
+            boundary = next_boundary()
+            self.stdout.write(self.style.SUCCESS(
+                f'Applied {applied} active promotion(s) in {time.monotonic() - started:.2f}s; '
+                f'next boundary: {boundary.isoformat() if boundary else "none"}'
+            ))
+            if not options['loop']:
+                return
+            wait = options['max_sleep']
+            if boundary is not None:
+                wait = min(wait, max((boundary - timezone.now()).total_seconds(), 0) + 0.5)
+            close_old_connections()
+            time.sleep(wait)
@@ -0,0 +1,56 @@
+"""
+Benchmark session encode/decode cost of the cart for 1 to 200-line carts.
+
+Compares the original cart format ({'id': {'quantity': n, 'price': '9.99'}}
+with Django's JSONSerializer) against the compact integer format with the
+shop serializer, going through SessionStore.encode/decode exactly as the
+session middleware does on every cart change.
+
+Usage:
+    python manage.py bench_cart_session
+    python manage.py bench_cart_session --lines 1,10,50,200 --repeat 2000
+"""
+
+import timeit
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.core.signing import JSONSerializer as DjangoJSONSerializer
+
+from shop.cart.serializers import HAS_ORJSON, JSONSerializer
+
+
+def legacy_cart(lines):
+    return {str(1000 + i): {'quantity': i % 5 + 1, 'price': f'{i % 300 + 0.99:.2f}'} for i in range(lines)}
+
+
+def compact_cart(lines):
+    return [n for i in range(lines) for n in (1000 + i, i % 5 + 1, (i % 300) * 100 + 99)]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark cart session encode/decode for legacy vs compact formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', default='1,10,50,100,200', help='Comma-separated cart sizes')
+        parser.add_argument('--repeat', type=int, default=1000, help='Iterations per measurement')
+
+    def measure(self, serializer, session_dict, repeat):
+        store = SessionStore()
+        store.serializer = serializer
+        encoded = store.encode(session_dict)
+        encode = timeit.timeit(lambda: store.encode(session_dict), number=repeat) / repeat * 1e6
+        decode = timeit.timeit(lambda: store.decode(encoded), number=repeat) / repeat * 1e6
+        return encode, decode, len(encoded)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        self.stdout.write(f"orjson: {'yes' if HAS_ORJSON else 'no (stdlib json fallback)'}")
+        self.stdout.write(f"{'lines':>6} {'format':>8} {'encode us':>10} {'decode us':>10} {'bytes':>7}")
+        for lines in [int(n) for n in options['lines'].split(',')]:
+            for label, serializer, cart in (
+                ('legacy', DjangoJSONSerializer, legacy_cart(lines)),
+                ('compact', JSONSerializer, compact_cart(lines)),
+            ):
+                encode, decode, size = self.measure(serializer, {'cart': cart}, repeat)
+                self.stdout.write(f'{lines:>6} {label:>8} {encode:>10.1f} {decode:>10.1f} {size:>7}')
@@ -0,0 +1,82 @@
+"""
+Compare connection set-up latency with and without the connection pool
+under bursty load.
+
+Each burst starts --concurrency threads at once, each behaving like a
+request: get a connection, run one query, give the connection back. Without
+the pool every request opens and closes its own connection; with it,
+connections are reused and at most --max-size are open. Reports the time
+each request waited for a usable connection and the pool's counters.
+
+Usage:
+    python manage.py bench_db_pool
+    python manage.py bench_db_pool --bursts 50 --concurrency 64 --max-size 10 --pause 0.1
+
+Needs DATABASE_URL to point at PostgreSQL.
+"""
+
+import threading
+import time
+from statistics import median, quantiles
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shop.dbpool import close_pools, pool_stats
+
+
+def request(alias, latencies):
+    connection = connections[alias]
+    try:
+        started = time.perf_counter()
+        connection.ensure_connection()
+        latencies.append((time.perf_counter() - started) * 1000)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Measure connection set-up latency with and without the connection pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bursts', type=int, default=20, help='Bursts of simultaneous requests')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests per burst')
+        parser.add_argument('--pause', type=float, default=0.2, help='Seconds between bursts')
+        parser.add_argument('--max-size', type=int, default=10, help='Pool size')
+
+    def run(self, alias, options):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(options['bursts']):
+            threads = [threading.Thread(target=request, args=(alias, latencies))
+                       for _ in range(options['concurrency'])]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            time.sleep(options['pause'])
+        elapsed = time.perf_counter() - started - options['bursts'] * options['pause']
+        return latencies, elapsed
+
+    def handle(self, *args, **options):
+        default = connections.settings['default']
+        if default['ENGINE'] not in ('django.db.backends.postgresql', 'shop.dbpool'):
+            raise CommandError('bench_db_pool needs a PostgreSQL DATABASE_URL.')
+        connections.settings['bench_direct'] = dict(default, ENGINE='django.db.backends.postgresql', CONN_MAX_AGE=0)
+        connections.settings['bench_pooled'] = dict(
+            default, ENGINE='shop.dbpool', CONN_MAX_AGE=0,
+            POOL=dict(default.get('POOL', {}), MIN_SIZE=1, MAX_SIZE=options['max_size']),
+        )
+        self.stdout.write(f"{'mode':<8}{'requests':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'req/s':>9}")
+        for alias in ('bench_direct', 'bench_pooled'):
+            latencies, elapsed = self.run(alias, options)
+            p95 = quantiles(latencies, n=20)[-1]
+            self.stdout.write(f'{alias[6:]:<8}{len(latencies):>10}{median(latencies):>9.2f}{p95:>9.2f}'
+                              f'{max(latencies):>9.2f}{len(latencies) / elapsed:>9.0f}')
+        stats = pool_stats()['bench_pooled']
+        self.stdout.write(f"pool: opened {stats['opened']}, waits {stats['waits']}, timeouts {stats['timeouts']}, "
+                          f"failed checks {stats['failed_checks']}")
+        close_pools()
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,94 @@
+"""
+Stress test for the fulfilment work queue.
+
+Creates a batch of synthetic pending orders, then runs 1, 2, 4 ... concurrent
+picker threads that claim, "pick" (sleep) and ship them, reporting throughput
+per picker count and checking that no order was claimed twice.
+
+Usage:
+    python manage.py bench_fulfilment
+    python manage.py bench_fulfilment --orders 1000 --pickers 1,2,4,8 --pick-ms 5
+
+Run it against PostgreSQL for meaningful scaling numbers; SQLite serialises
+writers, so claims there are correct but do not scale.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from django import db
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Order
+from shop.orders.fulfilment import claim_orders, transition
+
+BENCH_EMAIL = 'bench@fulfilment.invalid'
+
+
+def picker(name, batch, pick_seconds, claimed):
+    try:
+        while True:
+            orders = claim_orders(name, batch)
+            if not orders:
+                break
+            for order in orders:
+                claimed.append(order.id)
+                time.sleep(pick_seconds)
+                transition(order, 'shipped')
+    finally:
+        db.connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Measure fulfilment claim throughput and check for double-claims'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=400, help='Synthetic orders per round')
+        parser.add_argument('--pickers', default='1,2,4,8', help='Comma-separated picker counts')
+        parser.add_argument('--batch', type=int, default=5, help='Orders claimed per picker request')
+        parser.add_argument('--pick-ms', type=float, default=5.0, help='Simulated pick time per order')
+
+    def handle(self, *args, **options):
+        if Order.objects.filter(status='pending').exclude(email=BENCH_EMAIL).exists():
+            raise CommandError('Refusing to run: real pending orders exist and would be claimed.')
+
+        counts = [int(n) for n in options['pickers'].split(',')]
+        Order.objects.bulk_create([
+            Order(first_name='Bench', last_name=str(i), email=BENCH_EMAIL,
+                  address='-', postal_code='-', city='-')
+            for i in range(options['orders'])
+        ])
+        bench_orders = Order.objects.filter(email=BENCH_EMAIL)
+
+        self.stdout.write(f"{'pickers':>8} {'seconds':>9} {'orders/s':>9} {'speedup':>8} {'dupes':>6}")
+        baseline = None
+        failed = False
+        try:
+            for count in counts:
+                bench_orders.update(status='pending', claimed_by='')
+                claimed = []
+                threads = [
+                    threading.Thread(target=picker, args=(f'picker-{i}', options['batch'],
+                                                          options['pick_ms'] / 1000, claimed))
+                    for i in range(count)
+                ]
+                started = time.perf_counter()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                elapsed = time.perf_counter() - started
+
+                dupes = sum(n - 1 for n in Counter(claimed).values() if n > 1)
+                missed = bench_orders.exclude(status='shipped').count()
+                rate = len(claimed) / elapsed
+                baseline = baseline or rate
+                failed = failed or dupes or missed
+                self.stdout.write(f'{count:>8} {elapsed:>9.2f} {rate:>9.1f} {rate / baseline:>7.2f}x {dupes:>6}')
+        finally:
+            bench_orders.delete()
+
+        if failed:
+            raise CommandError('Double-claimed or unshipped orders detected.')
+        self.stdout.write(self.style.SUCCESS('No double-claims.'))
@@ -0,0 +1,60 @@
+"""
+Compare the HTML bytes each page sends with all CSS inlined (as before the
+bundles) and with only the critical CSS inlined, raw and compressed.
+
+The preloaded bundle is fetched once and then served from the browser cache
+under its hashed name, so its size is reported separately rather than added
+to every page.
+
+Usage:
+    python manage.py bench_html_size
+    python manage.py bench_html_size --paths /,/shop/,/cart/
+"""
+
+import gzip
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from shop.bundles import read_bundle
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+
+def sizes(content):
+    row = [len(content), len(gzip.compress(content))]
+    if HAS_BROTLI:
+        row.append(len(brotli.compress(content)))
+    return row
+
+
+class Command(BaseCommand):
+    help = 'Measure per-page HTML size with inlined and bundled CSS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', default='/,/shop/,/cart/,/wishlist/', help='Comma-separated paths to request')
+
+    def fetch(self, path, inline_all):
+        with override_settings(ASSETS_INLINE_ALL=inline_all, ALLOWED_HOSTS=['*']):
+            response = Client().get(path, secure=True)
+        return response.status_code, response.content
+
+    def handle(self, *args, **options):
+        columns = ['raw', 'gzip'] + (['br'] if HAS_BROTLI else [])
+        header = ''.join(f'{c:>16}' for c in columns)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{"page":<16}{header}'))
+        for path in options['paths'].split(','):
+            status, before = self.fetch(path, True)
+            _, after = self.fetch(path, False)
+            cells = ''.join(
+                f'{f"{b} -> {a}":>16}' for b, a in zip(sizes(before), sizes(after))
+            )
+            self.stdout.write(f'{path:<16}{cells}  ({status})')
+        bundle = read_bundle('shop/dist/site.css').encode()
+        cells = ''.join(f'{n:>16}' for n in sizes(bundle))
+        self.stdout.write(f'{"site.css (once)":<16}{cells}')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,66 @@
+"""
+Benchmark process start-up and first-request latency with and without warm-up.
+
+Each run starts a fresh Python process that loads wsgi.py (as a gunicorn
+worker does) and then requests a few pages in-process, so the first hit on
+each page pays whatever initialisation warm-up did not do in advance.
+
+Usage:
+    python manage.py bench_startup
+    python manage.py bench_startup --runs 5 --paths /,/shop/,/cart/
+"""
+
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import wsgi
+loaded = time.perf_counter()
+from django.test import Client
+from shop.warmup import STATE
+client = Client(HTTP_HOST='localhost')
+first = {}
+for path in sys.argv[1].split(','):
+    t = time.perf_counter()
+    status = client.get(path, secure=True).status_code
+    first[path] = ((time.perf_counter() - t) * 1000, status)
+print(json.dumps({'load_ms': (loaded - started) * 1000, 'first': first, 'steps': STATE['steps']}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start and first-request latency with and without warm-up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes per mode')
+        parser.add_argument('--paths', default='/,/shop/,/cart/', help='Comma-separated paths to request')
+
+    def probe(self, warm, paths):
+        env = dict(os.environ, WARMUP_ON_START=str(warm))
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, paths], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        paths = options['paths']
+        for warm in (False, True):
+            results = [self.probe(warm, paths) for _ in range(options['runs'])]
+            self.stdout.write(self.style.MIGRATE_HEADING('With warm-up' if warm else 'Without warm-up'))
+            self.stdout.write(f'  load wsgi.py      {median(r["load_ms"] for r in results):8.1f} ms')
+            for path in paths.split(','):
+                latency = median(r['first'][path][0] for r in results)
+                self.stdout.write(f'  first GET {path:<8}{latency:8.1f} ms  ({results[0]["first"][path][1]})')
+            if warm:
+                for step in results[0]['steps']:
+                    self.stdout.write(f'  warm-up {step:<10}{median(r["steps"][step] for r in results):8.1f} ms')
+        self.stdout.write(self.style.SUCCESS('Done'))
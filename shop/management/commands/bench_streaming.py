@@ -0,0 +1,77 @@
+"""
+Compare time-to-first-byte, total time and peak Python memory of the product
+list rendered in one piece and streamed in chunks.
+
+Creates a temporary category of synthetic products (deleted afterwards) and
+requests its list page in-process, reading the response the way a WSGI
+server does. Memory is the tracemalloc peak during the request, i.e. what the
+worker had to hold at once.
+
+Usage:
+    python manage.py bench_streaming
+    python manage.py bench_streaming --products 5000 --runs 5
+"""
+
+import time
+import tracemalloc
+from statistics import median
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from shop.models import Category, Product
+
+BENCH_SLUG = 'bench-streaming'
+
+
+def measure(path):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    response = Client().get(path, secure=True)
+    if response.streaming:
+        chunks = iter(response.streaming_content)
+        size = len(next(chunks))
+        first_byte = time.perf_counter()
+        size += sum(len(chunk) for chunk in chunks)
+    else:
+        first_byte = time.perf_counter()
+        size = len(response.content)
+    response.close()
+    total = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (first_byte - started) * 1000, (total - started) * 1000, peak / 1024, size
+
+
+class Command(BaseCommand):
+    help = 'Measure TTFB and peak memory of the product list with and without streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Synthetic products in the bench category')
+        parser.add_argument('--runs', type=int, default=3, help='Requests per mode')
+        parser.add_argument('--chunk-size', type=int, default=24, help='Products per streamed chunk')
+
+    def handle(self, *args, **options):
+        category = Category.objects.create(name='Bench streaming', slug=BENCH_SLUG)
+        try:
+            Product.objects.bulk_create([
+                Product(category=category, name=f'Bench product {i:05d}', slug=f'bench-product-{i}',
+                        description='A synthetic product used to benchmark list rendering. ' * 3,
+                        price=10, effective_price=10, stock=5)
+                for i in range(options['products'])
+            ])
+            path = reverse('shop:product_list_by_category', args=[BENCH_SLUG])
+            self.stdout.write(f"{'mode':<10}{'TTFB ms':>10}{'total ms':>10}{'peak KiB':>10}{'KiB sent':>10}")
+            for stream in (False, True):
+                with override_settings(STREAM_PRODUCT_LIST=stream, STREAM_CHUNK_SIZE=options['chunk_size'],
+                                       ALLOWED_HOSTS=['*']):
+                    measure(path)  # warm templates and caches
+                    results = [measure(path) for _ in range(options['runs'])]
+                ttfb, total, peak, size = (median(r[i] for r in results) for i in range(4))
+                self.stdout.write(f"{'streamed' if stream else 'buffered':<10}"
+                                  f'{ttfb:>10.1f}{total:>10.1f}{peak:>10.0f}{size / 1024:>10.0f}')
+        finally:
+            category.delete()
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,29 @@
+"""
+Management command to build the CSS bundles from shop/assets/css.
+
+Writes each bundle in ASSET_BUNDLES under ASSET_OUTPUT_DIR; run it after
+editing a source and commit the result. collectstatic then hashes and
+precompresses the bundles. --check only reports bundles that are stale and
+exits non-zero, for CI.
+
+Usage:
+    python manage.py build_assets
+    python manage.py build_assets --check
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.bundles import build_bundles
+
+
+class Command(BaseCommand):
+    help = 'Concatenate and minify the CSS sources into static bundles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Fail if any bundle is out of date')
+
+    def handle(self, *args, **options):
+        changed = build_bundles(check=options['check'])
+        if options['check'] and changed:
+            raise CommandError(f'Out of date, run build_assets: {", ".join(changed)}')
+        self.stdout.write(self.style.SUCCESS(f'Done: {len(changed)} bundle(s) rebuilt'))
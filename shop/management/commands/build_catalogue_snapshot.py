@@ -0,0 +1,33 @@
+"""
+Management command to build the shared memory-mapped catalogue snapshot.
+
+Writes categories and available products to CATALOGUE_SNAPSHOT_PATH and
+atomically replaces the previous snapshot; running workers pick it up on
+their next freshness check. Run it after deploys and catalogue imports.
+
+Usage:
+    python manage.py build_catalogue_snapshot
+    python manage.py build_catalogue_snapshot --path /tmp/catalogue.snapshot
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.snapshot import build
+
+
+class Command(BaseCommand):
+    help = 'Build the memory-mapped catalogue snapshot shared by all workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.CATALOGUE_SNAPSHOT_PATH, help='Output file')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        categories, products, size = build(options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {categories} categories, {products} products, {size / 1024:.1f} KiB '
+            f'in {time.monotonic() - started:.2f}s -> {options["path"]}'
+        ))
@@ -0,0 +1,112 @@
+"""
+Management command to garbage-collect content-addressed product images.
+
+Recounts how many products reference each blob in one UPDATE, then deletes
+blobs (and stray files under media/blobs/) that nothing references. A blob
+row is only deleted if, under a row lock, it is still unreferenced - an
+upload or product save since the recount keeps it - and only the files of
+rows actually deleted are removed. Blobs younger than --grace-minutes are
+kept so uploads in progress are never removed.
+
+Usage:
+    python manage.py gc_media
+    python manage.py gc_media --dry-run
+    python manage.py gc_media --adopt     # move pre-existing product images into blob storage first
+"""
+
+import os
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from shop.models import MediaBlob, Product
+from shop.storage import BLOB_PREFIX, is_blob, product_image_storage
+
+
+class Command(BaseCommand):
+    help = 'Delete product image blobs that no product references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Keep unreferenced blobs younger than this')
+        parser.add_argument('--adopt', action='store_true',
+                            help='Re-store legacy (non-blob) product images as blobs and remove the originals')
+        parser.add_argument('--dry-run', action='store_true', help='Report without deleting anything')
+
+    def handle(self, *args, **options):
+        storage = product_image_storage()
+        dry_run = options['dry_run']
+
+        if options['adopt'] and not dry_run:
+            self.adopt(storage)
+
+        references = Subquery(
+            Product.objects.filter(image=OuterRef('name')).order_by().values('image').annotate(n=Count('id')).values('n')
+        )
+        blobs = MediaBlob.objects.all()
+        if dry_run:
+            blobs = blobs.annotate(counted=Coalesce(references, 0))
+        else:
+            MediaBlob.objects.update(ref_count=Coalesce(references, 0))
+            blobs = blobs.annotate(counted=F('ref_count'))
+        counts = {name: (count, size, created_at)
+                  for name, count, size, created_at in blobs.values_list('name', 'counted', 'size', 'created_at')}
+
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        candidates = [name for name, (count, _, created_at) in counts.items() if count == 0 and created_at < cutoff]
+        doomed = candidates if dry_run else self.delete_unreferenced(candidates)
+        strays = [name for name, mtime in self.walk_blobs(storage)
+                  if name not in counts and mtime < cutoff.timestamp()]
+
+        freed = sum(counts[name][1] for name in doomed)
+        for name in doomed + strays:
+            self.stdout.write(f'  DELETE {name}')
+            if not dry_run:
+                storage.delete(name)
+
+        shared = sum(1 for count, _, _ in counts.values() if count > 1)
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(doomed)} blob(s) and {len(strays)} stray file(s), {freed / 1024:.0f} KiB; '
+            f'{len(counts) - len(doomed)} blob(s) kept, {shared} shared by several products'
+        ))
+
+    def delete_unreferenced(self, names):
+        """Delete the rows among `names` still unreferenced; returns the names deleted."""
+        with transaction.atomic():
+            rows = dict(
+                MediaBlob.objects.select_for_update()
+                .filter(name__in=names, ref_count=0)
+                .exclude(name__in=Product.objects.values('image'))
+                .values_list('id', 'name')
+            )
+            MediaBlob.objects.filter(id__in=rows).delete()
+        return sorted(rows.values())
+
+    def adopt(self, storage):
+        legacy = set()
+        for product in Product.objects.exclude(image='').iterator():
+            name = product.image.name
+            if is_blob(name) or not default_storage.exists(name):
+                continue
+            with default_storage.open(name) as f:
+                product.image.save(os.path.basename(name), File(f), save=True)
+            legacy.add(name)
+            self.stdout.write(f'  ADOPT  {name} -> {product.image.name}')
+        still_used = set(Product.objects.filter(image__in=legacy).values_list('image', flat=True))
+        for name in legacy - still_used:
+            default_storage.delete(name)
+
+    def walk_blobs(self, storage):
+        root = storage.path(BLOB_PREFIX)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                yield name, os.path.getmtime(path)
@@ -0,0 +1,32 @@
+"""
+Management command to generate sitemap.xml and the product shopping feed.
+
+Only sitemap/feed shards whose products changed since the last run are
+rewritten, so it is cheap to run often (e.g. every 15 minutes from cron).
+
+Usage:
+    python manage.py generate_feeds
+    python manage.py generate_feeds --full    # rewrite every shard
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.feeds import generate
+
+
+class Command(BaseCommand):
+    help = 'Generate sitemap.xml and product feeds (CSV/XML) for available products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the previous run and rewrite everything')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rewritten, total = generate(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {rewritten}/{total} product shard(s) rewritten in {time.monotonic() - started:.1f}s '
+            f'-> {settings.FEEDS_ROOT}'
+        ))
@@ -0,0 +1,32 @@
+"""
+Management command to queue wishlist price-drop and back-in-stock emails.
+
+Finds all changed wishlist items in one query and queues one
+wishlist.send_alerts job per batch of users; emails are sent by
+`manage.py run_workers`. Run it periodically, e.g. hourly from cron.
+
+Usage:
+    python manage.py notify_wishlists
+    python manage.py notify_wishlists --batch-users 500
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.wishlist.notifications import BATCH_USERS, notify_wishlists
+
+
+class Command(BaseCommand):
+    help = 'Queue wishlist alerts for products that dropped in price or came back in stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-users', type=int, default=BATCH_USERS,
+                            help=f'Users per queued email job (default: {BATCH_USERS})')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users, items = notify_wishlists(batch_users=options['batch_users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Queued alerts for {items} item(s) across {users} user(s) in {time.monotonic() - started:.2f}s'
+        ))
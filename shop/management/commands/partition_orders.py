@@ -0,0 +1,41 @@
+"""
+Management command to pre-create monthly partitions of the order archive.
+
+On PostgreSQL, shop_archivedorder is range-partitioned by month on created_at.
+This creates any missing partitions from the month of the oldest order up to
+--months-ahead months in the future. Run it from cron (e.g. daily) so
+partitions always exist before rows arrive. It is a no-op on SQLite.
+
+Usage:
+    python manage.py partition_orders
+    python manage.py partition_orders --months-ahead 6
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+
+from shop.models import Order
+from shop.orders.archive import add_months, ensure_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = 'Pre-create monthly partitions for archived orders (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future months to create')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('Partitioning is only used on PostgreSQL; nothing to do.'))
+            return
+
+        now = timezone.now()
+        oldest = Order.objects.aggregate(oldest=Min('created_at'))['oldest'] or now
+        last = add_months(month_start(now), options['months_ahead'])
+        created = ensure_partitions(oldest, last)
+
+        for name in created:
+            self.stdout.write(f'  CREATE {name}')
+        self.stdout.write(self.style.SUCCESS(f'Done: {len(created)} partition(s) created'))
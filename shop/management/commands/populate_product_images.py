@@ -220,6 +220,7 @@ class Command(BaseCommand):
         success_count = 0
         skip_count = 0
         fail_count = 0
+        downloaded = {}
 
         today = date.today()
         upload_subpath = f"products/{today.year}/{today.month:02d}/{today.day:02d}"
@@ -235,7 +236,10 @@ class Command(BaseCommand):
 
             self.stdout.write(f'  GET   {product.name} ...')
 
-            image_data = download_image(photo_id)
+            # Many products share a photo; download each one once per run
+            if photo_id not in downloaded:
+                downloaded[photo_id] = download_image(photo_id)
+            image_data = downloaded[photo_id]
             if not image_data:
                 self.stdout.write(self.style.ERROR(f'  FAIL  {product.name} - could not download image'))
                 fail_count += 1
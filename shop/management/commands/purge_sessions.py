@@ -0,0 +1,63 @@
+"""
+Management command to delete expired sessions in small batches.
+
+A replacement for clearsessions on large session tables: expired sessions
+are deleted in keyset-ordered batches (by expire_date, session_key), each in
+its own short transaction, optionally pausing between batches or capping
+the delete rate so the table stays responsive. Anonymous wishlist items
+keyed by a deleted session go with it. With --keep-carts, the products and
+quantities in each expired session's cart are saved to the AbandonedCart
+table first.
+
+Usage:
+    python manage.py purge_sessions
+    python manage.py purge_sessions --batch-size 500 --sleep 0.2
+    python manage.py purge_sessions --max-rate 2000 --keep-carts
+    python manage.py purge_sessions --dry-run
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.cart.abandoned import expired_sessions, purge_batch
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in batches, optionally keeping abandoned carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+        parser.add_argument('--max-rate', type=float, default=0.0, help='Cap on sessions deleted per second (0: none)')
+        parser.add_argument('--keep-carts', action='store_true', help='Save expired carts to AbandonedCart first')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many sessions have expired')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['dry_run']:
+            self.stdout.write(f'{expired_sessions(now).count()} expired session(s) would be deleted')
+            return
+
+        started = time.monotonic()
+        total = carts = 0
+        after = None
+        while True:
+            deleted, kept, after = purge_batch(now, after, options['batch_size'], options['keep_carts'])
+            if after is None:
+                break
+            total += deleted
+            carts += kept
+            self.stdout.write(f'  deleted {total} session(s), kept {carts} cart(s)')
+            pause = options['sleep']
+            if options['max_rate']:
+                pause = max(pause, total / options['max_rate'] - (time.monotonic() - started))
+            if pause > 0:
+                time.sleep(pause)
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {total} session(s) deleted, {carts} abandoned cart(s) kept in {elapsed:.1f}s ({rate:.0f}/s)'
+        ))
@@ -0,0 +1,90 @@
+"""
+Management command to run background job workers.
+
+Usage:
+    python manage.py run_workers                          # 1 process x 1 thread
+    python manage.py run_workers --processes 2 --threads 4
+    python manage.py run_workers --once                   # drain due jobs and exit
+"""
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from shop.jobs import requeue_stale, run_pending
+
+
+def work(worker_id, batch, poll_interval, once, stop):
+    try:
+        while not stop.is_set():
+            processed = run_pending(worker_id, batch)
+            if not processed:
+                if once:
+                    break
+                stop.wait(poll_interval)
+    finally:
+        db.connection.close()
+
+
+def run_process(index, threads, batch, poll_interval, once):
+    stop = threading.Event()
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    workers = [
+        threading.Thread(target=work, args=(f'{prefix}:{i}', batch, poll_interval, once, stop), daemon=True)
+        for i in range(threads)
+    ]
+    for t in workers:
+        t.start()
+    try:
+        for t in workers:
+            while t.is_alive():
+                t.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for t in workers:
+            t.join()
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers for queued post-checkout work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--threads', type=int, default=1, help='Worker threads per process')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue jobs left running longer than this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit once no due jobs remain')
+
+    def handle(self, *args, **options):
+        requeued, dead = requeue_stale(timedelta(seconds=options['stale_after']))
+        if requeued or dead:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s), {dead} now dead'))
+
+        args = (options['threads'], options['batch'], options['poll_interval'], options['once'])
+        self.stdout.write(f"Starting {options['processes']} process(es) x {options['threads']} thread(s)")
+        started = time.monotonic()
+
+        if options['processes'] == 1:
+            run_process(0, *args)
+        else:
+            # Child processes must open their own database connections
+            db.connections.close_all()
+            procs = [multiprocessing.Process(target=run_process, args=(i, *args)) for i in range(options['processes'])]
+            for p in procs:
+                p.start()
+            try:
+                for p in procs:
+                    p.join()
+            except KeyboardInterrupt:
+                for p in procs:
+                    p.join()
+
+        self.stdout.write(self.style.SUCCESS(f'Workers stopped after {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,36 @@
+"""
+Management command to load the initial catalogue into an empty database.
+
+Loads shop/fixtures/initial_data.json only when there are no categories yet,
+so deploys that run it every time never overwrite categories or products
+edited in the admin, then rebuilds the category paths that loaddata's raw
+saves leave blank.
+
+Usage:
+    python manage.py seed_catalogue
+    python manage.py seed_catalogue --force
+"""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Category
+
+FIXTURE = 'shop/fixtures/initial_data.json'
+
+
+class Command(BaseCommand):
+    help = 'Load the initial catalogue fixture if the catalogue is empty'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Load the fixture even if categories exist')
+
+    def handle(self, *args, **options):
+        if Category.objects.exists() and not options['force']:
+            self.stdout.write('Catalogue already seeded; nothing loaded')
+            return
+        with transaction.atomic():
+            call_command('loaddata', FIXTURE, verbosity=0)
+            rebuilt = Category.rebuild_paths()
+        self.stdout.write(self.style.SUCCESS(f'Done: loaded {FIXTURE}, rebuilt {rebuilt} category path(s)'))
@@ -0,0 +1,141 @@
+import random
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .profiling import RequestProfile, install_template_timing
+from .ratelimit import check_limits, get_in_flight, service_unavailable, too_many_requests
+from .routers import pin_to_primary
+from .streaming import on_close
+
+PRIMARY_PIN_SESSION_KEY = '_primary_pin_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin requests to the primary database when they write, and keep the
+    session pinned for REPLICA_STICKY_SECONDS afterwards so the next page
+    (e.g. the order confirmation after checkout) never reads a lagging replica.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session = getattr(request, 'session', None)
+        pinned_until = session.get(PRIMARY_PIN_SESSION_KEY, 0) if session is not None else 0
+        writes = request.method not in SAFE_METHODS
+
+        if not writes and pinned_until < time.time():
+            return self.get_response(request)
+
+        with pin_to_primary():
+            response = self.get_response(request)
+        if writes and session is not None:
+            session[PRIMARY_PIN_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile views in PROFILER_VIEW_MODULES when a staff user sends the
+    PROFILER_HEADER header, or for a random PROFILER_SAMPLE_RATE fraction of
+    requests. Profiles are browsable at /admin/profiles/. A streamed response
+    is profiled until its last chunk is sent, so it gets no X-Profile-File
+    header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timing()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+        if response.streaming:
+            on_close(response, lambda: self.finish(profile))
+        else:
+            response['X-Profile-File'] = self.finish(profile)
+        return response
+
+    def finish(self, profile):
+        profile.__exit__(None, None, None)
+        return profile.save()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func.__module__ not in settings.PROFILER_VIEW_MODULES:
+            return None
+        requested = request.headers.get(settings.PROFILER_HEADER) and request.user.is_staff
+        if requested or random.random() < settings.PROFILER_SAMPLE_RATE:
+            request._profile = RequestProfile(request).__enter__()
+        return None
+
+
+class LoadSheddingMiddleware:
+    """
+    Answer with a fast 503 when the workers already have too many requests in
+    flight (counted in Redis, see shop.ratelimit): browse traffic at
+    LOAD_SHED_BROWSE_FRACTION of LOAD_SHED_MAX_IN_FLIGHT, cart and checkout
+    traffic only at the full limit. LOAD_SHED_EXEMPT_URL_NAMES (/readyz,
+    /metrics) are never shed or counted. Disabled when LOAD_SHED_MAX_IN_FLIGHT
+    is 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limit = settings.LOAD_SHED_MAX_IN_FLIGHT
+        if not limit:
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            match = None
+        if match is not None and match.view_name in settings.LOAD_SHED_EXEMPT_URL_NAMES:
+            return self.get_response(request)
+        if match is None or match.namespace not in settings.LOAD_SHED_PRIORITY_NAMESPACES:
+            limit = max(1, int(limit * settings.LOAD_SHED_BROWSE_FRACTION))
+        tracker = get_in_flight()
+        token = tracker.enter(limit)
+        if not token:
+            return service_unavailable()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            tracker.leave(token)
+            raise
+        if response.streaming:
+            # Still in flight until the stream has been sent
+            on_close(response, lambda: tracker.leave(token))
+        else:
+            tracker.leave(token)
+        return response
+
+
+class RateLimitMiddleware:
+    """
+    Apply the token-bucket limits in RATE_LIMITS (keyed by URL name, e.g.
+    'cart:cart_add') to POSTs and other unsafe requests; see shop.ratelimit.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS or request.resolver_match is None:
+            return None
+        name = request.resolver_match.view_name
+        limits = settings.RATE_LIMITS.get(name)
+        if not limits:
+            return None
+        wait = check_limits(request, name, limits)
+        return too_many_requests(wait) if wait else None
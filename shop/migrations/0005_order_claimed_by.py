@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='shop_order_status_700268_idx'),
+        ),
+    ]
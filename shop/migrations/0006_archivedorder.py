@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:43
+
+from django.db import migrations, models
+
+# PostgreSQL requires the partition key to be part of the primary key, so the
+# real table has PRIMARY KEY (order_id, created_at); Django only needs to know
+# about order_id. Monthly partitions are created by shop.orders.archive.
+POSTGRES_SQL = """
+CREATE TABLE shop_archivedorder (
+    order_id bigint NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    status varchar(20) NOT NULL,
+    email varchar(254) NOT NULL,
+    total_price numeric(10, 2) NOT NULL,
+    data jsonb NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (order_id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX shop_archivedorder_email_idx ON shop_archivedorder (email);
+"""
+
+
+def create_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_SQL)
+    else:
+        schema_editor.create_model(apps.get_model('shop', 'ArchivedOrder'))
+
+
+def drop_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('shop', 'ArchivedOrder'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_order_claimed_by'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedOrder',
+                    fields=[
+                        ('order_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('created_at', models.DateTimeField()),
+                        ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                        ('email', models.EmailField(db_index=True, max_length=254)),
+                        ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                        ('data', models.JSONField()),
+                        ('archived_at', models.DateTimeField(auto_now_add=True)),
+                    ],
+                    options={
+                        'ordering': ('-created_at',),
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_table, drop_table),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_prices(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Product.objects.update(effective_price=models.F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_mediablob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('kind', models.CharField(choices=[('percent', 'Percentage off'), ('fixed', 'Fixed amount off')], default='percent', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ('-starts_at',),
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_produc_availab_c5dd6b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='shop_produc_availab_7320db_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, editable=False, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'category', 'effective_price'], name='shop_produc_availab_2aaf76_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'effective_price'], name='shop_produc_availab_06f4fc_idx'),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='shop.category'),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='shop.product'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(fields=['active', 'starts_at', 'ends_at'], name='shop_promot_active_b46ab6_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_root_paths(apps, schema_editor):
+    # Existing categories are all top-level
+    Category = apps.get_model('shop', 'Category')
+    for pk in Category.objects.values_list('pk', flat=True):
+        Category.objects.filter(pk=pk).update(path=f'{pk:08d}.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_wishlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='shop.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(set_root_paths, migrations.RunPython.noop),
+    ]
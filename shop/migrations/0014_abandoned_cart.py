@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbandonedCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expired_at', models.DateTimeField(db_index=True)),
+                ('items', models.JSONField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'ordering': ('-expired_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    # Order lookups match the lowercased address the forms now store
+    for model in ('Order', 'ArchivedOrder'):
+        manager = apps.get_model('shop', model).objects
+        manager.exclude(email=Lower('email')).update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_abandoned_cart'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,25 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.urls import reverse
+from django.utils import timezone
+
+from .storage import product_image_storage
 
 
 class Category(models.Model):
+    # Width of one materialised-path segment: a zero-padded id and a '.'
+    PATH_STEP = 9
+
     name = models.CharField(max_length=200, db_index=True)
     slug = models.SlugField(max_length=200, unique=True)
+    parent = models.ForeignKey('self', related_name='children', null=True, blank=True, on_delete=models.CASCADE)
+    # Ids of the root, ..., parent and this category, e.g. '00000001.00000007.', so
+    # a subtree is every row whose path starts with its root's path
+    path = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ('name',)
@@ -17,14 +32,76 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('shop:product_list_by_category', args=[self.slug])
 
+    @classmethod
+    def path_segment(cls, pk):
+        return f'{pk:0{cls.PATH_STEP - 1}d}.'
+
+    @property
+    def depth(self):
+        return len(self.path) // self.PATH_STEP - 1
+
+    def ancestor_ids(self):
+        return [int(self.path[i:i + self.PATH_STEP - 1]) for i in range(0, len(self.path) - self.PATH_STEP, self.PATH_STEP)]
+
+    @classmethod
+    def rebuild_paths(cls):
+        """
+        Recompute every path from the parent links, e.g. after loaddata, whose
+        raw saves bypass save(). Returns the number of categories changed.
+        """
+        categories = {c.pk: c for c in cls.objects.only('pk', 'parent_id', 'path')}
+        paths = {}
+
+        def path_of(category):
+            if category.pk not in paths:
+                parent = categories.get(category.parent_id)
+                paths[category.pk] = (path_of(parent) if parent else '') + cls.path_segment(category.pk)
+            return paths[category.pk]
+
+        changed = []
+        now = timezone.now()
+        for category in categories.values():
+            if category.path != path_of(category):
+                category.path, category.updated = paths[category.pk], now
+                changed.append(category)
+        cls.objects.bulk_update(changed, ['path', 'updated'])
+        return len(changed)
+
+    def get_descendants(self, include_self=True):
+        descendants = Category.objects.filter(path__startswith=self.path)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
+
+    def clean(self):
+        if self.parent_id and self.path and self.parent.path.startswith(self.path):
+            raise ValidationError('A category cannot be moved under itself or one of its sub-categories.')
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        old_path = self.path
+        super().save(*args, **kwargs)
+        parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id) if self.parent_id else ''
+        self.path = parent_path + self.path_segment(self.pk)
+        if self.path == old_path:
+            return
+        if old_path:
+            # Move the whole subtree with one UPDATE
+            Category.objects.filter(path__startswith=old_path).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                updated=timezone.now(),
+            )
+        else:
+            Category.objects.filter(pk=self.pk).update(path=self.path)
+
 
 class Product(models.Model):
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     name = models.CharField(max_length=200, db_index=True)
     slug = models.SlugField(max_length=200, db_index=True)
-    image = models.ImageField(upload_to='products/%Y/%m/%d', blank=True)
+    image = models.ImageField(upload_to='products/%Y/%m/%d', blank=True, storage=product_image_storage)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Price after promotions, maintained by shop.promotions.apply_promotions
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, editable=False)
     stock = models.PositiveIntegerField(default=0)
     available = models.BooleanField(default=True)
     created = models.DateTimeField(auto_now_add=True)
@@ -33,10 +110,24 @@ class Product(models.Model):
     class Meta:
         ordering = ('name',)
         index_together = (('id', 'slug'),)
+        indexes = [
+            models.Index(fields=['available', 'category', 'effective_price']),
+            models.Index(fields=['available', 'effective_price']),
+            models.Index(fields=['available', 'stock']),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.effective_price is None:
+            self.effective_price = self.price
+        super().save(*args, **kwargs)
+
+    @property
+    def on_sale(self):
+        return self.effective_price < self.price
+
     def get_absolute_url(self):
         return reverse('shop:product_detail', args=[self.id, self.slug])
 
@@ -49,6 +140,8 @@ class Order(models.Model):
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
     ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='orders', null=True, blank=True,
+                             on_delete=models.SET_NULL)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     email = models.EmailField()
@@ -57,11 +150,20 @@ class Order(models.Model):
     city = models.CharField(max_length=100)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    # Issued with the checkout form; a resubmitted form finds the order it
+    # already created instead of placing another
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['email', 'created_at']),
+        ]
 
     def __str__(self):
         return f'Order {self.id}'
@@ -78,3 +180,145 @@ class OrderItem(models.Model):
 
     def get_total_price(self):
         return self.price * self.quantity
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('dead', 'Dead'),
+    ]
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('run_at',)
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.name} #{self.id}'
+
+
+class ArchivedOrder(models.Model):
+    """
+    Delivered/cancelled orders moved out of the hot Order/OrderItem tables by
+    `manage.py archive_orders`. Items are kept inline in `data`. On PostgreSQL
+    the table is range-partitioned by month on created_at.
+    """
+    order_id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    email = models.EmailField(db_index=True)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    data = models.JSONField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'Archived order {self.order_id}'
+
+
+class AbandonedCart(models.Model):
+    """
+    The cart of a session that expired without checking out, kept by
+    `manage.py purge_sessions --keep-carts` when it deletes the session.
+    `items` is a flat [product_id, quantity, ...] list; ids are not foreign
+    keys so the history outlives deleted products.
+    """
+    expired_at = models.DateTimeField(db_index=True)
+    items = models.JSONField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ('-expired_at',)
+
+    def __str__(self):
+        return f'Abandoned cart {self.id}'
+
+
+class MediaBlob(models.Model):
+    """
+    One stored file in ContentAddressedStorage. `ref_count` is the number of
+    Product.image fields pointing at it; `manage.py gc_media` recounts and
+    deletes blobs nobody references.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('name',)
+
+    def __str__(self):
+        return self.name
+
+
+class WishlistItem(models.Model):
+    """
+    A product saved by a user, or by an anonymous visitor identified by a
+    random key kept in their session. notified_price/notified_in_stock are
+    what the owner last saw, so notify_wishlists only reports real changes.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='wishlist_items', null=True, blank=True,
+                             on_delete=models.CASCADE)
+    session_key = models.CharField(max_length=32, blank=True)
+    product = models.ForeignKey(Product, related_name='wishlist_items', on_delete=models.CASCADE)
+    notified_price = models.DecimalField(max_digits=10, decimal_places=2)
+    notified_in_stock = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], condition=models.Q(user__isnull=False),
+                                    name='wishlist_user_product'),
+            models.UniqueConstraint(fields=['session_key', 'product'], condition=models.Q(user__isnull=True),
+                                    name='wishlist_session_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.user or self.session_key}: {self.product_id}'
+
+
+class Promotion(models.Model):
+    KIND_CHOICES = [
+        ('percent', 'Percentage off'),
+        ('fixed', 'Fixed amount off'),
+    ]
+    name = models.CharField(max_length=200)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='percent')
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    product = models.ForeignKey(Product, related_name='promotions', on_delete=models.CASCADE, null=True, blank=True)
+    category = models.ForeignKey(Category, related_name='promotions', on_delete=models.CASCADE,
+                                 null=True, blank=True)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ('-starts_at',)
+        indexes = [models.Index(fields=['active', 'starts_at', 'ends_at'])]
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if bool(self.product_id) == bool(self.category_id):
+            raise ValidationError('Choose either a product or a category.')
+        if self.ends_at and self.starts_at and self.ends_at <= self.starts_at:
+            raise ValidationError('The promotion must end after it starts.')
+        if self.kind == 'percent' and not 0 < self.value <= 100:
+            raise ValidationError('Percentage must be between 0 and 100.')
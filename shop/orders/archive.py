@@ -0,0 +1,105 @@
+"""
+Helpers for moving old orders out of the hot Order/OrderItem tables.
+
+See `manage.py archive_orders` and `manage.py partition_orders`.
+"""
+
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from shop.models import ArchivedOrder, Order
+
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+
+PARTITION_SQL = (
+    'CREATE TABLE IF NOT EXISTS {name} PARTITION OF shop_archivedorder '
+    "FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+)
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def partition_name(month):
+    return f'shop_archivedorder_y{month:%Y}m{month:%m}'
+
+
+def ensure_partitions(first, last):
+    """
+    Create monthly partitions of shop_archivedorder covering first..last.
+    Returns the names of newly created partitions; a no-op outside PostgreSQL.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    existing = set(connection.introspection.table_names())
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            with connection.cursor() as cursor:
+                # Partition bounds are UTC midnights; the session time zone is UTC (USE_TZ)
+                cursor.execute(PARTITION_SQL.format(name=name, start=month, end=add_months(month, 1)))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def serialize_order(order):
+    return {
+        'id': order.id,
+        'user_id': order.user_id,
+        'first_name': order.first_name,
+        'last_name': order.last_name,
+        'email': order.email,
+        'address': order.address,
+        'postal_code': order.postal_code,
+        'city': order.city,
+        'status': order.status,
+        'total_price': str(order.total_price),
+        'created_at': order.created_at.isoformat(),
+        'updated_at': order.updated_at.isoformat(),
+        'items': [
+            {
+                'product_id': item.product_id,
+                'product_name': item.product.name,
+                'price': str(item.price),
+                'quantity': item.quantity,
+            }
+            for item in order.items.all()
+        ],
+    }
+
+
+def archive_batch(ids, jsonl=None):
+    """
+    Move one batch of orders (and their items) out of the hot tables, either
+    into ArchivedOrder or, when `jsonl` is an open text file, as JSON lines.
+    Each batch is its own short transaction. Returns the number archived.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.filter(id__in=ids, status__in=ARCHIVABLE_STATUSES)
+            .prefetch_related('items__product')
+        )
+        records = [serialize_order(order) for order in orders]
+        if jsonl is not None:
+            for record in records:
+                jsonl.write(json.dumps(record) + '\n')
+            jsonl.flush()
+        else:
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(order_id=order.id, created_at=order.created_at, status=order.status,
+                              email=order.email, total_price=order.total_price, data=record)
+                for order, record in zip(orders, records)
+            ])
+        Order.objects.filter(id__in=[order.id for order in orders]).delete()
+    return len(orders)
@@ -1,8 +1,21 @@
+import re
+import secrets
+
 from django import forms
 from shop.models import Order
 
+IDEMPOTENCY_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def new_idempotency_key():
+    return secrets.token_urlsafe(24)
+
 
 class OrderCreateForm(forms.ModelForm):
+    # A fresh key each time the form is shown; resubmitting the same form
+    # sends the same key back
+    idempotency_key = forms.CharField(widget=forms.HiddenInput, required=False, initial=new_idempotency_key)
+
     class Meta:
         model = Order
         fields = ['first_name', 'last_name', 'email', 'address', 'postal_code', 'city']
@@ -14,3 +27,18 @@ class OrderCreateForm(forms.ModelForm):
             'postal_code': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Postal Code'}),
             'city': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'City'}),
         }
+
+    def clean_email(self):
+        # Guest order history is looked up by exact (indexed) email match
+        return self.cleaned_data['email'].lower()
+
+    def clean_idempotency_key(self):
+        key = self.cleaned_data['idempotency_key']
+        return key if IDEMPOTENCY_KEY_RE.match(key) else None
+
+
+class OrderLookupForm(forms.Form):
+    email = forms.EmailField(widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Email'}))
+
+    def clean_email(self):
+        return self.cleaned_data['email'].lower()
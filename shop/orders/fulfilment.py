@@ -0,0 +1,76 @@
+"""
+Fulfilment work queue for warehouse pickers.
+
+Pickers call claim_orders() to atomically take the oldest pending orders
+(pending -> processing), then move each order on with transition(). Claims
+use SELECT ... FOR UPDATE SKIP LOCKED where supported so concurrent pickers
+never block on or double-claim the same rows; on SQLite each order is claimed
+with a conditional UPDATE instead.
+
+transition() uses optimistic concurrency on Order.updated_at: if the order
+was changed since it was loaded (by another picker or in the admin), the
+update matches no rows and StaleOrderError is raised.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from shop.models import Order, OrderItem
+
+TRANSITIONS = {
+    'pending': {'processing', 'cancelled'},
+    'processing': {'shipped', 'pending', 'cancelled'},
+    'shipped': {'delivered'},
+}
+
+
+class StaleOrderError(Exception):
+    pass
+
+
+class InvalidTransitionError(Exception):
+    pass
+
+
+def _with_items(queryset):
+    return queryset.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+    )
+
+
+def claim_orders(picker, limit=10):
+    pending = Order.objects.filter(status='pending').order_by('created_at', 'id')
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(pending.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Order.objects.filter(id__in=ids).update(status='processing', claimed_by=picker, updated_at=now)
+    else:
+        ids = []
+        for order_id in pending.values_list('id', flat=True)[:limit]:
+            if Order.objects.filter(id=order_id, status='pending').update(
+                    status='processing', claimed_by=picker, updated_at=now):
+                ids.append(order_id)
+    return list(_with_items(Order.objects.filter(id__in=ids)).order_by('created_at', 'id'))
+
+
+def transition(order, status):
+    if status not in TRANSITIONS.get(order.status, ()):
+        raise InvalidTransitionError(f'{order} cannot move from {order.status} to {status}')
+    now = timezone.now()
+    changes = {'status': status, 'updated_at': now}
+    if status == 'pending':
+        changes['claimed_by'] = ''
+    updated = Order.objects.filter(id=order.id, status=order.status, updated_at=order.updated_at).update(**changes)
+    if not updated:
+        raise StaleOrderError(f'{order} was modified by someone else')
+    for field, value in changes.items():
+        setattr(order, field, value)
+    return order
+
+
+def release_orders(picker):
+    """Return a picker's unfinished orders to the pending queue."""
+    return Order.objects.filter(status='processing', claimed_by=picker).update(
+        status='pending', claimed_by='', updated_at=timezone.now())
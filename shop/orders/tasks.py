@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.urls import reverse
+
+from shop.jobs import job
+from shop.models import Order
+
+from .history import history_token, order_token
+
+
+@job('orders.send_confirmation')
+def send_confirmation(order_id):
+    order = Order.objects.prefetch_related('items__product').get(id=order_id)
+    link = settings.SITE_URL.rstrip('/') + reverse('orders:order_placed', args=[order.id]) + f'?token={order_token(order)}'
+    lines = [f'{item.quantity} x {item.product.name} - £{item.get_total_price()}' for item in order.items.all()]
+    send_mail(
+        f'Ipswich Retail - Order #{order.id} confirmation',
+        'Thank you for your order.\n\n' + '\n'.join(lines) + f'\n\nTotal: £{order.total_price}'
+        f'\n\nView your order: {link}',
+        settings.DEFAULT_FROM_EMAIL,
+        [order.email],
+    )
+
+
+@job('orders.send_history_link')
+def send_history_link(email):
+    if not Order.objects.filter(email=email).exists():
+        return
+    link = settings.SITE_URL.rstrip('/') + reverse('orders:order_history') + f'?token={history_token(email)}'
+    send_mail(
+        'Ipswich Retail - Your orders',
+        f'Use this link to view your orders (valid for {settings.ORDER_HISTORY_LINK_MAX_AGE // 3600} hours):\n\n{link}',
+        settings.DEFAULT_FROM_EMAIL,
+        [email],
+    )
@@ -6,4 +6,6 @@ app_name = 'orders'
 urlpatterns = [
     path('create/', views.order_create, name='order_create'),
     path('placed/<int:order_id>/', views.order_placed, name='order_placed'),
+    path('history/', views.order_history, name='order_history'),
+    path('lookup/', views.order_lookup, name='order_lookup'),
 ]
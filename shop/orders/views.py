@@ -1,30 +1,70 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.urls import reverse
 from shop.models import Order, OrderItem
 from shop.cart.cart import Cart
-from .forms import OrderCreateForm
+from shop.jobs import enqueue
+from .forms import OrderCreateForm, OrderLookupForm
+from .history import can_view_order, customer_orders, email_from_history_token, order_token
+
+
+def _redirect_to_placed(order):
+    return redirect(reverse('orders:order_placed', args=[order.id]) + f'?token={order_token(order)}')
+
+
+def _order_for_key(key):
+    if not key:
+        return None
+    try:
+        return Order.objects.only('id').get(idempotency_key=key)
+    except Order.DoesNotExist:
+        return None
 
 
 def order_create(request):
+    if request.method == 'POST':
+        # A double-click or browser retry of a form that already placed its
+        # order: one lookup on the unique key index, before any other work
+        order = _order_for_key(request.POST.get('idempotency_key'))
+        if order is not None:
+            return _redirect_to_placed(order)
     cart = Cart(request)
     if len(cart) == 0:
         return redirect('cart:cart_detail')
+    repriced = cart.revalidate()
+    if repriced:
+        messages.warning(request, 'Some prices or availability in your cart have changed. Please review your order.')
+        if len(cart) == 0:
+            return redirect('cart:cart_detail')
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
-        if form.is_valid():
+        if form.is_valid() and not repriced:
             order = form.save(commit=False)
+            order.idempotency_key = form.cleaned_data['idempotency_key']
             order.total_price = cart.get_total_price()
-            order.save()
-            for item in cart:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    price=item['price'],
-                    quantity=item['quantity'],
-                )
+            if request.user.is_authenticated:
+                order.user = request.user
+            try:
+                with transaction.atomic():
+                    order.save()
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product=item['product'], price=item['price'],
+                                  quantity=item['quantity'])
+                        for item in cart
+                    ])
+                    enqueue('orders.send_confirmation', order_id=order.id)
+            except IntegrityError:
+                # A concurrent submission of the same form committed first
+                existing = _order_for_key(order.idempotency_key)
+                if existing is None:
+                    raise
+                cart.clear()
+                return _redirect_to_placed(existing)
             cart.clear()
             messages.success(request, f'Order #{order.id} created successfully!')
-            return redirect('orders:order_placed', order_id=order.id)
+            return _redirect_to_placed(order)
     else:
         form = OrderCreateForm()
     return render(request, 'shop/pages/cart/checkout.html', {'cart': cart, 'form': form})
@@ -32,4 +72,38 @@ def order_create(request):
 
 def order_placed(request, order_id):
     order = get_object_or_404(Order, id=order_id)
+    if not can_view_order(request, order):
+        raise Http404
     return render(request, 'shop/orders/placed.html', {'order': order})
+
+
+def order_history(request):
+    token = request.GET.get('token')
+    if request.user.is_authenticated:
+        owner = {'user': request.user}
+    elif token:
+        email = email_from_history_token(token)
+        if email is None:
+            messages.warning(request, 'That link has expired. Enter your email to get a new one.')
+            return redirect('orders:order_lookup')
+        owner = {'email': email}
+    else:
+        return redirect('orders:order_lookup')
+    orders, next_cursor = customer_orders(cursor=request.GET.get('after'), **owner)
+    return render(request, 'shop/orders/history.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'token': token if not request.user.is_authenticated else None,
+    })
+
+
+def order_lookup(request):
+    if request.method == 'POST':
+        form = OrderLookupForm(request.POST)
+        if form.is_valid():
+            enqueue('orders.send_history_link', email=form.cleaned_data['email'])
+            messages.success(request, 'If we have orders for that address, we have emailed you a link to them.')
+            return redirect('orders:order_lookup')
+    else:
+        form = OrderLookupForm()
+    return render(request, 'shop/orders/lookup.html', {'form': form})
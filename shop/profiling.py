@@ -0,0 +1,188 @@
+"""
+Per-request sampling profiler used by ProfilingMiddleware.
+
+A background thread samples the request thread's Python stack every
+PROFILER_INTERVAL_MS while SQL queries and template renders are timed. The
+result is written as a speedscope file (https://www.speedscope.app) with
+three profiles: the sampled CPU stacks, an SQL timeline and a template
+timeline. A matching .folded file of collapsed stacks can be fed to
+flamegraph.pl. Only the newest PROFILER_MAX_FILES profiles are kept.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+SPEEDSCOPE_SUFFIX = '.speedscope.json'
+FOLDED_SUFFIX = '.folded'
+
+_active = threading.local()
+_template_patch_lock = threading.Lock()
+_template_patched = False
+
+
+def install_template_timing():
+    """Wrap Template.render once so renders on profiled threads are timed."""
+    global _template_patched
+    with _template_patch_lock:
+        if _template_patched:
+            return
+        original_render = Template.render
+
+        def render(self, context):
+            profile = getattr(_active, 'profile', None)
+            if profile is None:
+                return original_render(self, context)
+            start = time.perf_counter()
+            try:
+                return original_render(self, context)
+            finally:
+                profile.templates.append((start, time.perf_counter(), self.origin.template_name or self.origin.name))
+
+        Template.render = render
+        _template_patched = True
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.queries = []
+        self.templates = []
+        self.sampler = Sampler(threading.get_ident(), settings.PROFILER_INTERVAL_MS / 1000)
+        self.start = self.end = None
+
+    def _record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((start, time.perf_counter(), sql))
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        _active.profile = self
+        self._wrappers = [conn.execute_wrapper(self._record_query) for conn in connections.all()]
+        for wrapper in self._wrappers:
+            wrapper.__enter__()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sampler.stop()
+        for wrapper in reversed(self._wrappers):
+            wrapper.__exit__(*exc_info)
+        _active.profile = None
+        self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self):
+        return (self.end - self.start) * 1000
+
+    def to_speedscope(self):
+        frames = []
+        frame_index = {}
+
+        def index(key):
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                name, file, line = key
+                frames.append({'name': name, 'file': file, 'line': line})
+            return frame_index[key]
+
+        def ms(t):
+            return (t - self.start) * 1000
+
+        samples, weights = [], []
+        previous = self.start
+        for at, stack in self.sampler.samples:
+            samples.append([index(frame) for frame in stack])
+            weights.append(ms(at) - ms(previous))
+            previous = at
+
+        def evented(name, spans, label):
+            events = []
+            for start, end, text in spans:
+                frame = index((label(text), '', 0))
+                events.append({'type': 'O', 'frame': frame, 'at': ms(start)})
+                events.append({'type': 'C', 'frame': frame, 'at': ms(end)})
+            # Nested spans (e.g. {% include %}) must close innermost-first
+            events.sort(key=lambda e: (e['at'], e['type'] == 'O'))
+            return {'type': 'evented', 'name': name, 'unit': 'milliseconds',
+                    'startValue': 0, 'endValue': self.duration_ms, 'events': events}
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': f'{self.method} {self.path}',
+            'exporter': 'ipswich-retail',
+            'shared': {'frames': frames},
+            'profiles': [
+                {'type': 'sampled', 'name': 'CPU samples', 'unit': 'milliseconds',
+                 'startValue': 0, 'endValue': self.duration_ms, 'samples': samples, 'weights': weights},
+                evented(f'SQL ({len(self.queries)} queries)', self.queries, lambda sql: sql[:200]),
+                evented('Templates', self.templates, lambda name: name),
+            ],
+        }
+
+    def to_folded(self):
+        stacks = Counter(
+            ';'.join(f'{name} ({os.path.basename(file)}:{line})' for name, file, line in stack)
+            for _, stack in self.sampler.samples
+        )
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.items() if stack)
+
+    def save(self):
+        directory = Path(settings.PROFILER_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', self.path).strip('-') or 'root'
+        base = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{self.method}-{slug[:60]}-{self.duration_ms:.0f}ms'
+        (directory / (base + SPEEDSCOPE_SUFFIX)).write_text(json.dumps(self.to_speedscope()))
+        (directory / (base + FOLDED_SUFFIX)).write_text(self.to_folded())
+        trim_profiles(directory, settings.PROFILER_MAX_FILES)
+        return base + SPEEDSCOPE_SUFFIX
+
+
+def list_profiles():
+    directory = Path(settings.PROFILER_DIR)
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob('*' + SPEEDSCOPE_SUFFIX), reverse=True)
+
+
+def trim_profiles(directory, keep):
+    for path in sorted(directory.glob('*' + SPEEDSCOPE_SUFFIX), reverse=True)[keep:]:
+        path.unlink(missing_ok=True)
+        path.with_name(path.name[:-len(SPEEDSCOPE_SUFFIX)] + FOLDED_SUFFIX).unlink(missing_ok=True)
@@ -0,0 +1,83 @@
+"""
+Promotions price engine.
+
+Product.effective_price holds each product's price after the best active
+promotion. apply_promotions() recomputes it with one UPDATE that sets it to
+the lowest of the price and every applicable promotion's discounted price,
+touching only rows whose effective price actually changes, so storefront,
+cart and checkout code only ever read that column. It runs at every promotion start/end boundary (`manage.py
+apply_promotions --loop`), when a Promotion is saved, and for a single
+product when that product is saved.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Q, Value, When
+from django.db.models.functions import Greatest, Least, Round
+from django.utils import timezone
+
+from .catalogue import bump_catalogue_version
+from .models import Product, Promotion
+
+PRICE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+
+def active_promotions(now):
+    return Promotion.objects.filter(active=True, starts_at__lte=now, ends_at__gt=now)
+
+
+def discounted_price(promotion):
+    if promotion.kind == 'percent':
+        factor = (Decimal(100) - promotion.value) / Decimal(100)
+        price = Round(F('price') * Value(factor), 2)
+    else:
+        price = Greatest(F('price') - Value(promotion.value), Value(Decimal('0')))
+    return ExpressionWrapper(price, output_field=PRICE_FIELD)
+
+
+def target_price(promotions):
+    """The lowest of the price and each applicable promotion's price, as one expression."""
+    prices = [F('price')]
+    for promotion in promotions:
+        scope = Q(id=promotion.product_id) if promotion.product_id else Q(category_id=promotion.category_id)
+        prices.append(Case(When(scope, then=discounted_price(promotion)), default=F('price'),
+                           output_field=PRICE_FIELD))
+    return Least(*prices) if len(prices) > 1 else prices[0]
+
+
+def apply_promotions(now=None, products=None):
+    """
+    Recompute effective prices for `products` (default: the whole catalogue).
+    Returns the number of active promotions applied.
+    """
+    now = now or timezone.now()
+    products = Product.objects.all() if products is None else products
+    promotions = list(active_promotions(now))
+    target = target_price(promotions)
+    # Rows already at their target keep their `updated` stamp, so the
+    # snapshot, feeds and facet caches only see real price changes
+    changed = products.exclude(effective_price=target).update(effective_price=target, updated=now)
+    if changed:
+        bump_catalogue_version()
+    return len(promotions)
+
+
+def next_boundary(now=None):
+    """The next time a promotion starts or ends, or None."""
+    now = now or timezone.now()
+    upcoming = Promotion.objects.filter(active=True)
+    starts = upcoming.filter(starts_at__gt=now).order_by('starts_at').values_list('starts_at', flat=True).first()
+    ends = upcoming.filter(ends_at__gt=now).order_by('ends_at').values_list('ends_at', flat=True).first()
+    return min(filter(None, (starts, ends)), default=None)
+
+
+def reprice_product(sender, instance, raw=False, **kwargs):
+    """post_save receiver for Product: keep effective_price in step with price edits."""
+    if not raw:
+        apply_promotions(products=Product.objects.filter(pk=instance.pk))
+
+
+def reprice_catalogue(sender, raw=False, **kwargs):
+    """post_save/post_delete receiver for Promotion."""
+    if not raw:
+        apply_promotions()
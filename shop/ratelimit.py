@@ -0,0 +1,268 @@
+"""
+Token-bucket rate limiting and priority-aware load shedding.
+
+Limits are configured per URL name in settings.RATE_LIMITS, e.g.
+
+    RATE_LIMITS = {'cart:cart_add': {'ip': '60/m', 'session': '20/m'}}
+
+'20/m' is a bucket holding 20 tokens that refills at 20 per minute, so
+bursts up to the full size are allowed and sustained traffic is held to the
+rate. Each POST (or other unsafe request) to the view takes one token from
+the client IP's bucket and one from the session's; when either is empty the
+request gets a 429 with Retry-After. RateLimitMiddleware applies the setting;
+@rate_limit() does the same for a single view.
+
+Buckets live in Redis when REDIS_URL is set, and are updated by a Lua
+script so workers on every host share them atomically. Without Redis they
+are kept in process memory - fine for development and single-process
+deployments.
+
+LoadSheddingMiddleware counts requests in flight across every worker: in a
+Redis sorted set of request ids scored by start time when REDIS_URL is set
+(entries older than LOAD_SHED_REQUEST_TIMEOUT are dropped, so a killed
+worker cannot leak its count). Above LOAD_SHED_BROWSE_FRACTION of
+LOAD_SHED_MAX_IN_FLIGHT, browse requests get an immediate 503; cart and
+checkout requests (LOAD_SHED_PRIORITY_NAMESPACES) are only shed at the full
+limit. Without Redis only the current process's requests are counted, which
+is meaningless with gunicorn's one-request-at-a-time sync workers.
+
+Both fail open: while Redis is unreachable, requests are neither limited
+nor shed, rather than all failing with a 500.
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+RATE_LIMIT_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+IN_FLIGHT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local timeout = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - timeout)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], timeout)
+return 1
+"""
+
+KEY_PREFIX = 'shop:'
+
+
+def parse_rate(rate):
+    """'20/m' -> (capacity 20, refill 20/60 tokens per second)."""
+    count, unit = rate.split('/')
+    return int(count), int(count) / UNITS[unit]
+
+
+class MemoryBuckets:
+    """In-process buckets, used when no Redis cache is configured."""
+
+    max_keys = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                # A bucket that has refilled is the same as a missing one
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBuckets:
+    def __init__(self, client):
+        self.script = client.register_script(RATE_LIMIT_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        try:
+            return float(self.script(keys=[KEY_PREFIX + key], args=[capacity, rate, time.time()]))
+        except redis.RedisError as e:
+            logger.warning('Rate limiting skipped, Redis is unavailable: %s', e)
+            return 0.0
+
+    def clear(self):
+        pass
+
+
+_redis = None
+
+
+def get_redis():
+    """A client for REDIS_URL, or None when Redis is not configured."""
+    global _redis
+    if _redis is None and settings.REDIS_URL and HAS_REDIS:
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+_buckets = None
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        client = get_redis()
+        _buckets = RedisBuckets(client) if client else MemoryBuckets()
+    return _buckets
+
+
+def client_ip(request):
+    if settings.RATE_LIMIT_IP_HEADER:
+        ip = request.META.get(settings.RATE_LIMIT_IP_HEADER, '').split(',')[0].strip()
+        if ip:
+            return ip
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_limits(request, name, limits):
+    """Take a token from each of the request's buckets; returns seconds to wait, or 0."""
+    owners = {'ip': client_ip(request), 'session': getattr(request, 'session', None) and request.session.session_key}
+    wait = 0.0
+    buckets = get_buckets()
+    for scope, rate in limits.items():
+        if not owners.get(scope):
+            continue
+        capacity, refill = parse_rate(rate)
+        wait = max(wait, buckets.take(f'rl:{name}:{scope}:{owners[scope]}', capacity, refill))
+    return wait
+
+
+def too_many_requests(wait):
+    response = HttpResponse('Too many requests, please slow down.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def rate_limit(name=None, **limits):
+    """
+    Decorator form of RATE_LIMITS for a single view:
+
+        @rate_limit(ip='60/m', session='20/m')
+    """
+    def decorator(view):
+        key = name or f'{view.__module__}.{view.__name__}'
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+                wait = check_limits(request, key, limits)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+class InFlight:
+    """Requests currently being handled by this worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def enter(self, limit):
+        with self._lock:
+            if self.count >= limit:
+                return None
+            self.count += 1
+            return True
+
+    def leave(self, token):
+        with self._lock:
+            self.count -= 1
+
+
+class RedisInFlight:
+    """Requests currently being handled by every worker sharing REDIS_URL."""
+
+    key = KEY_PREFIX + 'in-flight'
+
+    def __init__(self, client):
+        self.client = client
+        self.script = client.register_script(IN_FLIGHT_SCRIPT)
+
+    def enter(self, limit):
+        token = uuid.uuid4().hex
+        args = [time.time(), limit, settings.LOAD_SHED_REQUEST_TIMEOUT, token]
+        try:
+            return token if self.script(keys=[self.key], args=args) else None
+        except redis.RedisError as e:
+            logger.warning('Load shedding skipped, Redis is unavailable: %s', e)
+            return token
+
+    def leave(self, token):
+        try:
+            self.client.zrem(self.key, token)
+        except redis.RedisError as e:
+            # The entry expires after LOAD_SHED_REQUEST_TIMEOUT anyway
+            logger.warning('Could not release in-flight request in Redis: %s', e)
+
+
+in_flight = InFlight()
+_shared_in_flight = None
+
+
+def get_in_flight():
+    global _shared_in_flight
+    client = get_redis()
+    if client is None:
+        return in_flight
+    if _shared_in_flight is None:
+        _shared_in_flight = RedisInFlight(client)
+    return _shared_in_flight
+
+
+def service_unavailable():
+    response = HttpResponse('The shop is very busy right now, please try again shortly.', status=503,
+                            content_type='text/plain')
+    response['Retry-After'] = str(settings.LOAD_SHED_RETRY_AFTER)
+    return response
@@ -0,0 +1,61 @@
+"""
+Database router that sends catalogue reads to read replicas.
+
+Only Category and Product reads are eligible for a replica; everything else
+(orders, sessions, auth, admin) always uses the primary ('default'). A request
+can be pinned to the primary with `pin_to_primary()` so that read-after-write
+within the same request (or shortly after, see ReplicaPinningMiddleware) never
+sees a lagging replica.
+
+Configure replicas in settings via REPLICA_DATABASES (a list of aliases in
+DATABASES). With no replicas configured every query goes to 'default'.
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+CATALOGUE_MODELS = {'shop.category', 'shop.product'}
+
+_state = threading.local()
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', 0) > 0
+
+
+@contextmanager
+def pin_to_primary():
+    _state.pinned = getattr(_state, 'pinned', 0) + 1
+    try:
+        yield
+    finally:
+        _state.pinned -= 1
+
+
+class PrimaryReplicaRouter:
+    def _replicas(self):
+        return list(getattr(settings, 'REPLICA_DATABASES', []))
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in CATALOGUE_MODELS or is_pinned():
+            return 'default'
+        replicas = self._replicas()
+        if not replicas:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary, so relations between
+        # objects loaded from different aliases are always valid.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Allowed everywhere so a local SQLite replica can be built with
+        # `migrate --database=replica`; real replicas are read-only anyway.
+        return True
@@ -0,0 +1,349 @@
+"""
+Immutable, memory-mapped catalogue snapshot shared by all worker processes.
+
+`manage.py build_catalogue_snapshot` writes categories and available products
+into one compact binary file of array-backed columns. Every gunicorn worker
+maps the same file read-only, so the pages live once in the OS page cache
+instead of once per process, and a freshly started worker needs no queries
+to know the catalogue. The sidebar, the product list cards and the product
+detail page are served from it while it is fresh (see shop/views.py).
+
+File layout (little-endian): a header, a table of (offset, length) pairs for
+each column in COLUMNS order, then the columns themselves, 8-byte aligned.
+Strings live in one UTF-8 pool and are referenced by offset/length columns.
+Products are stored in id order; product_name_order lists their indices in
+the database's name order (product_name_rank is its inverse), so sorting
+never needs to decode every name. product_price_order lists them by
+effective price, and product_category_order groups them by category, with
+category_product_start/count giving each category's range in it, so a
+filtered product list only visits the rows it could show.
+
+The build reads everything in one transaction (repeatable read on
+PostgreSQL), and products whose category is missing are left out rather
+than breaking readers.
+
+Rebuilds write a new file and atomically rename it over the old one;
+get_snapshot() notices the new inode and remaps. When the snapshot is older
+than CATALOGUE_SNAPSHOT_MAX_AGE, or its fingerprint (product and category
+counts, latest Product/Category.updated) no longer matches the database,
+get_snapshot() returns None and callers fall back to the ORM.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from .models import Category, Product
+
+MAGIC = b'IRCS'
+FORMAT_VERSION = 4
+HEADER = struct.Struct('<4sIdqqII')
+
+# (name, array typecode) in file order
+COLUMNS = [
+    ('category_ids', 'q'),
+    ('category_name_off', 'I'), ('category_name_len', 'I'),
+    ('category_slug_off', 'I'), ('category_slug_len', 'I'),
+    ('category_path_off', 'I'), ('category_path_len', 'I'),
+    ('category_product_start', 'I'), ('category_product_count', 'I'),
+    ('product_ids', 'q'),
+    ('product_category_ids', 'q'),
+    ('product_price_pence', 'q'),
+    ('product_effective_pence', 'q'),
+    ('product_stock', 'I'),
+    ('product_created', 'q'),
+    ('product_name_order', 'I'),
+    ('product_name_rank', 'I'),
+    ('product_price_order', 'I'),
+    ('product_category_order', 'I'),
+    ('product_name_off', 'I'), ('product_name_len', 'I'),
+    ('product_slug_off', 'I'), ('product_slug_len', 'I'),
+    ('product_description_off', 'I'), ('product_description_len', 'I'),
+    ('strings', 'B'),
+]
+TABLE = struct.Struct('<' + 'QQ' * len(COLUMNS))
+
+
+class SnapshotCategory:
+    def __init__(self, id, name, slug, path):
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.path = path
+
+    def __str__(self):
+        return self.name
+
+    get_absolute_url = Category.get_absolute_url
+    PATH_STEP = Category.PATH_STEP
+    depth = Category.depth
+    ancestor_ids = Category.ancestor_ids
+
+
+class SnapshotProduct:
+    def __init__(self, id, slug, name, description, price, effective_price, stock, category):
+        self.id = id
+        self.slug = slug
+        self.name = name
+        self.description = description
+        self.price = price
+        self.effective_price = effective_price
+        self.stock = stock
+        self.category = category
+        self.category_id = category.id
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def in_stock(self):
+        return self.stock > 0
+
+    on_sale = Product.on_sale
+    get_absolute_url = Product.get_absolute_url
+
+
+def fingerprint():
+    row = Product.objects.aggregate(count=Count('id'), updated=Max('updated'))
+    categories = Category.objects.aggregate(count=Count('id'), updated=Max('updated'))
+    latest = max(filter(None, (row['updated'], categories['updated'])), default=None)
+    updated = int(latest.timestamp() * 1_000_000) if latest else 0
+    return row['count'] + categories['count'], updated
+
+
+def build(path):
+    """Write a snapshot of the current catalogue to `path` atomically."""
+    columns = {name: array(code) for name, code in COLUMNS}
+    pool = bytearray()
+
+    def add_string(prefix, value):
+        data = value.encode('utf-8')
+        columns[prefix + '_off'].append(len(pool))
+        columns[prefix + '_len'].append(len(data))
+        pool.extend(data)
+
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            # Counts, categories and products must all come from one snapshot
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        count, updated = fingerprint()
+        categories = Category.objects.order_by('name', 'id').values_list('id', 'name', 'slug', 'path')
+        for id, name, slug, category_path in categories:
+            columns['category_ids'].append(id)
+            add_string('category_name', name)
+            add_string('category_slug', slug)
+            add_string('category_path', category_path)
+        known = set(columns['category_ids'])
+
+        available = Product.objects.filter(available=True)
+        products = available.order_by('id').values_list(
+            'id', 'category_id', 'price', 'effective_price', 'stock', 'created', 'name', 'slug', 'description')
+        index = {}
+        for id, category_id, price, effective_price, stock, created, name, slug, description in \
+                products.iterator(chunk_size=2000):
+            if category_id not in known:
+                continue
+            index[id] = len(columns['product_ids'])
+            columns['product_ids'].append(id)
+            columns['product_category_ids'].append(category_id)
+            columns['product_price_pence'].append(int(price * 100))
+            columns['product_effective_pence'].append(int(effective_price * 100))
+            columns['product_stock'].append(stock)
+            columns['product_created'].append(int(created.timestamp() * 1_000_000))
+            add_string('product_name', name)
+            add_string('product_slug', slug)
+            add_string('product_description', description)
+        for id in available.order_by('name', 'id').values_list('id', flat=True).iterator(chunk_size=2000):
+            if id in index:
+                columns['product_name_order'].append(index[id])
+
+    name_order = columns['product_name_order']
+    rank = columns['product_name_rank']
+    rank.extend([0] * len(name_order))
+    by_category = {id: [] for id in columns['category_ids']}
+    for position, i in enumerate(name_order):
+        rank[i] = position
+        by_category[columns['product_category_ids'][i]].append(i)
+    effective = columns['product_effective_pence']
+    columns['product_price_order'].extend(sorted(name_order, key=lambda i: (effective[i], rank[i])))
+    for id in columns['category_ids']:
+        columns['category_product_start'].append(len(columns['product_category_order']))
+        columns['category_product_count'].append(len(by_category[id]))
+        columns['product_category_order'].extend(by_category[id])
+    columns['strings'].frombytes(bytes(pool))
+
+    offset = HEADER.size + TABLE.size
+    table, blobs = [], []
+    for name, _ in COLUMNS:
+        data = columns[name].tobytes()
+        padding = -offset % 8
+        offset += padding
+        blobs.append(b'\0' * padding + data)
+        table += [offset, len(data)]
+        offset += len(data)
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, time.time(), updated, count,
+                            len(columns['category_ids']), len(columns['product_ids'])))
+        f.write(TABLE.pack(*table))
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp, path)
+    return len(columns['category_ids']), len(columns['product_ids']), offset
+
+
+class CatalogueSnapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.inode = os.fstat(f.fileno()).st_ino
+        magic, version, self.built_at, self.updated, self.row_total, n_categories, n_products = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a catalogue snapshot (format {FORMAT_VERSION})')
+        table = TABLE.unpack_from(self._mmap, HEADER.size)
+        view = memoryview(self._mmap)
+        self._views = []
+        for i, (name, code) in enumerate(COLUMNS):
+            start, length = table[2 * i], table[2 * i + 1]
+            column = view[start:start + length].cast(code)
+            self._views.append(column)
+            setattr(self, name, column)
+        self._views.append(view)
+        self._category_index = {id: i for i, id in enumerate(self.category_ids)}
+
+    def _string(self, prefix, i):
+        start = getattr(self, prefix + '_off')[i]
+        return bytes(self.strings[start:start + getattr(self, prefix + '_len')[i]]).decode('utf-8')
+
+    def _category(self, i):
+        return SnapshotCategory(self.category_ids[i], self._string('category_name', i),
+                                self._string('category_slug', i), self._string('category_path', i))
+
+    def _product(self, i, categories):
+        category_id = self.product_category_ids[i]
+        if category_id not in categories:
+            categories[category_id] = self._category(self._category_index[category_id])
+        return SnapshotProduct(
+            self.product_ids[i], self._string('product_slug', i), self._string('product_name', i),
+            self._string('product_description', i), Decimal(self.product_price_pence[i]).scaleb(-2),
+            Decimal(self.product_effective_pence[i]).scaleb(-2), self.product_stock[i], categories[category_id],
+        )
+
+    def categories(self):
+        return [self._category(i) for i in range(len(self.category_ids))]
+
+    def products(self, category_ids=None, min_price=None, max_price=None, in_stock=False, sort='name',
+                 categories=None):
+        """
+        Available products, filtered and ordered like the product list's
+        queryset (see SORT_ORDERING). Candidates come from the price or
+        category index, whichever is narrower, so only rows that could match
+        are visited. Products are built as they are consumed; pass
+        `categories` ({id: category}) to reuse category objects.
+        """
+        low = None if min_price is None else int(min_price * 100)
+        high = None if max_price is None else int(max_price * 100)
+        effective = self.product_effective_pence
+        rank = self.product_name_rank
+        candidates, ordered_by = self.product_name_order, 'name'
+        if low is not None or high is not None:
+            order = self.product_price_order
+            start = 0 if low is None else bisect_left(order, low, key=effective.__getitem__)
+            stop = len(order) if high is None else bisect_left(order, high, key=effective.__getitem__)
+            candidates, ordered_by = order[start:stop], 'price'
+        if category_ids is not None:
+            ranges = [(self.category_product_start[c], self.category_product_count[c])
+                      for c in map(self._category_index.get, category_ids) if c is not None]
+            if sum(count for _, count in ranges) < len(candidates):
+                grouped = self.product_category_order
+                candidates = [i for start, count in ranges for i in grouped[start:start + count]]
+                ordered_by = 'name' if len(ranges) == 1 else None
+        indices = [
+            i for i in candidates
+            if (category_ids is None or self.product_category_ids[i] in category_ids)
+            and (low is None or effective[i] >= low)
+            and (high is None or effective[i] < high)
+            and (not in_stock or self.product_stock[i] > 0)
+        ]
+        if sort == 'price':
+            if ordered_by != 'price':
+                indices.sort(key=lambda i: (effective[i], rank[i]))
+        elif sort == '-price':
+            indices.sort(key=lambda i: (-effective[i], rank[i]))
+        elif sort == 'newest':
+            indices.sort(key=lambda i: (-self.product_created[i], rank[i]))
+        elif ordered_by != 'name':
+            indices.sort(key=rank.__getitem__)
+        categories = {} if categories is None else categories
+        return (self._product(i, categories) for i in indices)
+
+    def product(self, product_id):
+        i = bisect_left(self.product_ids, product_id)
+        if i < len(self.product_ids) and self.product_ids[i] == product_id:
+            return self._product(i, {})
+        return None
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._mmap.close()
+
+
+_lock = threading.Lock()
+_current = None
+_last_check = 0.0
+_fresh = False
+
+
+def get_snapshot():
+    """The mapped snapshot if it is present and fresh, otherwise None."""
+    global _current, _last_check, _fresh
+    path = settings.CATALOGUE_SNAPSHOT_PATH
+    now = time.time()
+    with _lock:
+        if now - _last_check >= settings.CATALOGUE_SNAPSHOT_CHECK_INTERVAL:
+            _last_check = now
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                _current, _fresh = None, False
+                return None
+            if _current is None or _current.inode != inode:
+                # Threads still holding the old mapping keep it alive until they finish
+                try:
+                    _current = CatalogueSnapshot(path)
+                except ValueError:
+                    _current, _fresh = None, False
+                    return None
+            _fresh = (_current.row_total, _current.updated) == fingerprint()
+        if _current is None or not _fresh or now - _current.built_at > settings.CATALOGUE_SNAPSHOT_MAX_AGE:
+            return None
+        return _current
+
+
+def reset():
+    global _current, _last_check, _fresh
+    with _lock:
+        _current, _last_check, _fresh = None, 0.0, False
+
+
+def catalogue_categories():
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.categories()
+    return list(Category.objects.all())
@@ -0,0 +1,98 @@
+"""
+Content-addressed, deduplicating file storage for product images.
+
+Files are named by the SHA-256 of their content (blobs/ab/cd/<hash>.jpg), so
+identical uploads are stored once and a name never changes content, which
+lets browsers cache media forever. Each blob has a MediaBlob row whose
+ref_count tracks the Product.image fields using it (see shop.apps signals);
+`manage.py gc_media` deletes blobs that are no longer referenced.
+
+The upload_to path of the field is ignored apart from its file extension.
+Files saved before this storage existed stay where they are and keep working.
+"""
+
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, ext):
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Names are content hashes: an existing file already holds this content
+        return name
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        ext = os.path.splitext(name)[1]
+        name = blob_name(content_hash(content), ext)
+        if not self.exists(name):
+            # Write under a unique name, then atomically move into place; a
+            # concurrent upload of the same content just replaces identical bytes.
+            tmp = super()._save(f'{BLOB_PREFIX}/tmp/{uuid.uuid4().hex}{ext}', content)
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+            os.replace(self.path(tmp), self.path(name))
+        MediaBlob.objects.get_or_create(name=name, defaults={'size': content.size})
+        return name
+
+
+def product_image_storage():
+    return ContentAddressedStorage()
+
+
+def _add_reference(name, delta):
+    from .models import MediaBlob
+
+    if not is_blob(name):
+        return
+    blobs = MediaBlob.objects.filter(name=name)
+    if delta < 0:
+        blobs = blobs.filter(ref_count__gte=-delta)
+    blobs.update(ref_count=F('ref_count') + delta)
+
+
+def remember_old_image(sender, instance, **kwargs):
+    """pre_save receiver: note which blob the row pointed at before saving."""
+    if instance.pk:
+        instance._old_image = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+    else:
+        instance._old_image = None
+
+
+def update_image_references(sender, instance, **kwargs):
+    """post_save receiver: move the reference from the old blob to the new one."""
+    old, new = getattr(instance, '_old_image', None), instance.image.name
+    if old != new:
+        _add_reference(old, -1)
+        _add_reference(new, 1)
+
+
+def release_image_reference(sender, instance, **kwargs):
+    """post_delete receiver."""
+    _add_reference(instance.image.name, -1)
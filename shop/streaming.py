@@ -0,0 +1,93 @@
+"""
+Streaming page rendering.
+
+render() builds the whole page before sending a byte, so on a large product
+list time-to-first-byte is the full render time and memory grows with the
+number of products. stream_render() instead renders the page shell - head,
+navbar, sidebar, everything but the item grid - with a marker where the
+grid goes, and returns a StreamingHttpResponse that sends the shell at once,
+then renders the items `chunk_size` at a time straight from a database
+iterator, then the rest of the page. Only one chunk of model instances and
+HTML is held in memory at any time.
+
+The page template outputs `{{ stream }}` where the items belong when it is
+set, and renders the items itself otherwise (see shop/product/list.html);
+`item_template` renders one chunk, given as `items_name`.
+
+The chunks render after the middleware has returned, so the generator
+re-enters pin_to_primary() when the view ran pinned, and middleware that
+must wrap the whole response (profiling, load shedding) hooks its cleanup
+to the end of the stream with on_close().
+"""
+
+from contextlib import nullcontext
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.context import make_context
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from .routers import is_pinned, pin_to_primary
+
+STREAM_MARKER = mark_safe('<!-- stream -->')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ClosingIterator:
+    """
+    Iterate `iterable`, then call `callback` once when the response is
+    closed: after the last chunk has been sent, or when the client went away.
+    """
+
+    def __init__(self, iterable, callback):
+        self.iterable = iterable
+        self.callback = callback
+
+    def __iter__(self):
+        yield from self.iterable
+
+    def close(self):
+        callback, self.callback = self.callback, None
+        if callback is not None:
+            callback()
+
+
+def on_close(response, callback):
+    response.streaming_content = ClosingIterator(response.streaming_content, callback)
+
+
+def stream_render(request, template_name, context, item_template, items_name, items, chunk_size):
+    # Chunks render after the middleware has run, too late for a first use
+    # of {% csrf_token %} to set the cookie
+    get_token(request)
+    shell = render_to_string(template_name, {**context, 'stream': STREAM_MARKER}, request)
+    head, tail = shell.split(STREAM_MARKER, 1)
+    pinned = is_pinned()
+
+    def content():
+        yield head
+        # Bind once so context processors run once, not per chunk
+        template = get_template(item_template).template
+        item_context = make_context(context, request)
+        with pin_to_primary() if pinned else nullcontext(), item_context.bind_template(template):
+            empty = True
+            for chunk in chunked(items, chunk_size):
+                empty = False
+                with item_context.push({items_name: chunk}):
+                    yield template.render(item_context)
+            if empty:
+                with item_context.push({items_name: []}):
+                    yield template.render(item_context)
+        yield tail
+
+    response = StreamingHttpResponse(content())
+    # Tell nginx to pass chunks on as they come rather than buffer the page
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,31 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from shop.bundles import bundle_url, read_bundle
+
+register = template.Library()
+
+
+@register.simple_tag
+def inline_css(name):
+    """Inline a (small, critical) bundle so the first paint needs no extra request."""
+    return mark_safe(f'<style>{read_bundle(name)}</style>')
+
+
+@register.simple_tag
+def stylesheet(name):
+    """
+    Preload a bundle by its hashed URL and apply it when it arrives, without
+    blocking rendering; <noscript> falls back to a plain stylesheet link.
+    With ASSETS_INLINE_ALL the bundle is inlined instead, as every page used to be.
+    """
+    if settings.ASSETS_INLINE_ALL:
+        return inline_css(name)
+    url = bundle_url(name)
+    return format_html(
+        '<link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+        '<noscript><link rel="stylesheet" href="{}"></noscript>',
+        url, url,
+    )
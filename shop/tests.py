@@ -1,8 +1,47 @@
-from django.test import TestCase, Client
+import csv
+import gzip
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from urllib.parse import urlsplit
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from decimal import Decimal
-from .models import Category, Product, Order, OrderItem
+from . import bundles, catalogue, dbpool, feeds, jobs, ratelimit, routers, snapshot, warmup
+from .forms import SORT_ORDERING
+from .models import (
+    AbandonedCart, Category, Product, Order, OrderItem, Job, ArchivedOrder, MediaBlob, Promotion, WishlistItem,
+)
 from .cart.cart import Cart
+from .management.commands import gc_media
+from .catalogue import category_tree, facet_counts, get_catalogue_version, price_filter, subtree_ids
+from .promotions import apply_promotions, next_boundary
+from .orders.history import customer_orders, history_token, order_token
+from .wishlist import notifications
+from .wishlist.notifications import notify_wishlists
+from .orders.fulfilment import InvalidTransitionError, StaleOrderError, claim_orders, transition
+from .middleware import PRIMARY_PIN_SESSION_KEY
+from .profiling import list_profiles
+from .routers import PrimaryReplicaRouter, pin_to_primary
+from .streaming import chunked as streaming_chunked
 
 
 class CategoryModelTest(TestCase):
@@ -145,3 +184,1084 @@ class ProductDetailViewTest(TestCase):
         self.assertTemplateUsed(response, 'shop/product/detail.html')
         self.assertContains(response, 'Laptop')
         self.assertContains(response, '999.99')
+
+
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_reads_use_primary_without_replicas(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_catalogue_reads_use_replica(self):
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+        self.assertEqual(self.router.db_for_read(Category), 'replica1')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_pinned_reads_use_primary(self):
+        with pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'replica1')
+
+    def test_write_pins_session(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        product = Product.objects.create(category=category, name='Laptop', slug='laptop', price=Decimal('1.00'))
+        self.client.post(reverse('cart:cart_add', args=[product.id]), {'quantity': 1})
+        self.assertGreater(self.client.session[PRIMARY_PIN_SESSION_KEY], 0)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.job('tests.record')(lambda **kwargs: self.calls.append(kwargs))
+
+        def fail(**kwargs):
+            raise ValueError('boom')
+        jobs.job('tests.fail')(fail)
+
+    def test_enqueue_and_run(self):
+        job = jobs.enqueue('tests.record', value=1)
+        self.assertEqual(jobs.run_pending('test-worker'), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(self.calls, [{'value': 1}])
+        self.assertEqual(jobs.run_pending('test-worker'), 0)
+
+    def test_failed_job_retries_then_dies(self):
+        job = jobs.enqueue('tests.fail', max_attempts=2)
+        jobs.run_pending('test-worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        jobs.run_pending('test-worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'dead')
+        self.assertIn('boom', job.last_error)
+
+    def test_stale_job_counts_an_attempt_then_dies(self):
+        job = jobs.enqueue('tests.record', max_attempts=2)
+        for expected in [(1, 0), (0, 1)]:
+            jobs.claim_jobs('crashed')
+            Job.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(jobs.requeue_stale(timedelta(minutes=10)), expected)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('dead', 2, ''))
+        self.assertEqual(jobs.claim_jobs('next'), [])
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        jobs.enqueue('tests.record')
+        self.assertEqual(len(jobs.claim_jobs('a')), 1)
+        self.assertEqual(jobs.claim_jobs('b'), [])
+
+    def test_checkout_enqueues_confirmation(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        product = Product.objects.create(category=category, name='Laptop', slug='laptop', price=Decimal('10.00'))
+        self.client.post(reverse('cart:cart_add', args=[product.id]), {'quantity': 2})
+        self.client.post(reverse('orders:order_create'), {
+            'first_name': 'John', 'last_name': 'Doe', 'email': 'john@example.com',
+            'address': '1 High St', 'postal_code': 'IP1 1AA', 'city': 'Ipswich',
+        })
+        job = Job.objects.get(name='orders.send_confirmation')
+        self.assertEqual(jobs.run_pending('test-worker'), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class FulfilmentTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        product = Product.objects.create(category=category, name='Laptop', slug='laptop', price=Decimal('10.00'))
+        for i in range(3):
+            order = Order.objects.create(first_name='John', last_name=str(i), email='john@example.com',
+                                         address='1 High St', postal_code='IP1 1AA', city='Ipswich')
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+
+    def test_claims_do_not_overlap(self):
+        first = claim_orders('picker-1', limit=2)
+        second = claim_orders('picker-2', limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({o.id for o in first} & {o.id for o in second})
+        self.assertEqual(first[0].status, 'processing')
+        self.assertEqual(first[0].claimed_by, 'picker-1')
+        with self.assertNumQueries(0):
+            self.assertEqual(first[0].items.all()[0].product.name, 'Laptop')
+
+    def test_transition_detects_concurrent_change(self):
+        order = claim_orders('picker-1', limit=1)[0]
+        stale = Order.objects.get(id=order.id)
+        transition(order, 'shipped')
+        self.assertEqual(Order.objects.get(id=order.id).status, 'shipped')
+        with self.assertRaises(StaleOrderError):
+            transition(stale, 'cancelled')
+
+    def test_invalid_transition(self):
+        order = Order.objects.first()
+        with self.assertRaises(InvalidTransitionError):
+            transition(order, 'delivered')
+
+
+class ArchiveOrdersTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        product = Product.objects.create(category=category, name='Laptop', slug='laptop', price=Decimal('10.00'))
+        self.old = timezone.now() - timedelta(days=800)
+        for status in ('delivered', 'cancelled', 'pending'):
+            order = Order.objects.create(first_name='John', last_name='Doe', email='john@example.com',
+                                         address='1 High St', postal_code='IP1 1AA', city='Ipswich',
+                                         status=status, total_price=Decimal('10.00'))
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+        Order.objects.update(created_at=self.old)
+        Order.objects.create(first_name='Jane', last_name='Doe', email='jane@example.com',
+                             address='1 High St', postal_code='IP1 1AA', city='Ipswich', status='delivered')
+
+    def test_archive_to_table(self):
+        call_command('archive_orders', months=12, batch_size=1, stdout=StringIO())
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'pending', 'delivered'})
+        self.assertEqual(OrderItem.objects.count(), 1)
+        archived = ArchivedOrder.objects.get(status='delivered')
+        self.assertEqual(archived.data['items'][0]['product_name'], 'Laptop')
+
+    def test_archive_to_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'orders.jsonl.gz')
+            call_command('archive_orders', months=12, jsonl=path, stdout=StringIO())
+            with gzip.open(path, 'rt') as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(ArchivedOrder.objects.count(), 0)
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class ProductFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.books = Category.objects.create(name='Books', slug='books')
+        Product.objects.create(category=self.electronics, name='Laptop', slug='laptop', price=Decimal('999.99'), stock=5)
+        Product.objects.create(category=self.electronics, name='Cable', slug='cable', price=Decimal('9.99'), stock=0)
+        Product.objects.create(category=self.books, name='Clean Code', slug='clean-code', price=Decimal('30.00'), stock=3)
+
+    def test_price_and_stock_filters(self):
+        response = self.client.get(reverse('shop:product_list'), {'min_price': '25', 'max_price': '50'})
+        self.assertEqual([p.name for p in response.context['products']], ['Clean Code'])
+        response = self.client.get(reverse('shop:product_list'), {'in_stock': '1', 'sort': '-price'})
+        self.assertEqual([p.name for p in response.context['products']], ['Laptop', 'Clean Code'])
+
+    def test_invalid_filters_are_ignored(self):
+        response = self.client.get(reverse('shop:product_list'), {'min_price': 'abc', 'sort': 'bogus'})
+        self.assertEqual(len(response.context['products']), 3)
+        response = self.client.get(reverse('shop:product_list'), {'min_price': 'abc', 'sort': '-price'})
+        self.assertEqual([p.name for p in response.context['products']], ['Laptop', 'Clean Code', 'Cable'])
+
+    def test_facet_counts_single_query_and_cached(self):
+        with self.assertNumQueries(1):
+            facets = facet_counts({self.electronics.id}, Decimal('0'), Decimal('25'))
+        self.assertEqual(facets['categories'], {self.electronics.id: 1, self.books.id: 0})
+        self.assertEqual([b['count'] for b in facets['price_buckets']], [1, 0, 0, 0, 0, 1])
+        with self.assertNumQueries(0):
+            facet_counts({self.electronics.id}, Decimal('0'), Decimal('25'))
+
+    def test_unshared_cache_keeps_facets_briefly(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            facet_counts()
+            with self.settings(REDIS_URL='redis://cache:6379/0'):
+                facet_counts(in_stock=True)
+        self.assertEqual([c.args[2] for c in cache_set.call_args_list],
+                         [catalogue.LOCAL_FACET_CACHE_SECONDS, catalogue.FACET_CACHE_SECONDS])
+
+    def test_catalogue_change_invalidates_facets(self):
+        facet_counts()
+        Product.objects.create(category=self.books, name='Refactoring', slug='refactoring', price=Decimal('40.00'))
+        self.assertEqual(facet_counts()['total'], 4)
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        Product.objects.create(category=category, name='Laptop', slug='laptop', price=Decimal('999.99'))
+
+    @override_settings(STREAM_PRODUCT_LIST=False)
+    def test_staff_header_writes_speedscope_profile(self):
+        self.client.force_login(self.staff)
+        with self.settings(PROFILER_DIR=self.tmp.name):
+            response = self.client.get(reverse('shop:product_list'), HTTP_X_PROFILE='1')
+            name = response['X-Profile-File']
+            with open(os.path.join(self.tmp.name, name)) as f:
+                profile = json.load(f)
+            self.assertEqual([p['type'] for p in profile['profiles']], ['sampled', 'evented', 'evented'])
+            self.assertTrue(profile['profiles'][1]['events'])
+            self.assertTrue(profile['profiles'][2]['events'])
+        with self.settings(PROFILER_DIR=self.tmp.name,
+                           STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            listing = self.client.get(reverse('profile_list'))
+            self.assertContains(listing, name)
+
+    @override_settings(STREAM_PRODUCT_LIST=True)
+    def test_streamed_response_profiled_until_sent(self):
+        self.client.force_login(self.staff)
+        with self.settings(PROFILER_DIR=self.tmp.name):
+            response = self.client.get(reverse('shop:product_list'), HTTP_X_PROFILE='1')
+            self.assertNotIn('X-Profile-File', response)
+            self.assertEqual(os.listdir(self.tmp.name), [])
+            b''.join(response.streaming_content)
+            [path] = list_profiles()
+        # The card query runs while the stream is sent
+        self.assertIn('shop_product', path.read_text())
+
+    def test_anonymous_header_is_ignored(self):
+        with self.settings(PROFILER_DIR=self.tmp.name):
+            response = self.client.get(reverse('shop:product_list'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-File', response)
+
+    def test_ring_buffer_keeps_newest(self):
+        self.client.force_login(self.staff)
+        with self.settings(PROFILER_DIR=self.tmp.name, PROFILER_MAX_FILES=2):
+            for _ in range(3):
+                self.client.get(reverse('shop:about'), HTTP_X_PROFILE='1')
+        self.assertEqual(len(os.listdir(self.tmp.name)), 4)
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media = self.settings(MEDIA_ROOT=tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.category = Category.objects.create(name='Books', slug='books')
+
+    def make_product(self, slug, data=b'same image bytes'):
+        product = Product.objects.create(category=self.category, name=slug, slug=slug, price=Decimal('9.99'))
+        product.image.save(f'{slug}.jpg', ContentFile(data), save=True)
+        return product
+
+    def test_identical_images_stored_once(self):
+        first = self.make_product('clean-code')
+        second = self.make_product('html-book')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('blobs/'))
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertTrue(first.image.storage.exists(blob.name))
+
+    def test_gc_deletes_unreferenced_blobs(self):
+        first = self.make_product('clean-code')
+        second = self.make_product('html-book', b'other image')
+        old_name = second.image.name
+        second.delete()
+        self.assertEqual(MediaBlob.objects.get(name=old_name).ref_count, 0)
+        call_command('gc_media', grace_minutes=-1, stdout=StringIO())
+        self.assertEqual(list(MediaBlob.objects.values_list('name', flat=True)), [first.image.name])
+        self.assertFalse(first.image.storage.exists(old_name))
+        self.assertTrue(first.image.storage.exists(first.image.name))
+
+    def test_gc_keeps_blob_referenced_after_recount(self):
+        product = self.make_product('clean-code')
+        name = product.image.name
+        product.delete()
+        command = gc_media.Command(stdout=StringIO())
+        real_delete = command.delete_unreferenced
+
+        def delete_after_reuse(names):
+            # Another product picks the blob up between the recount and the delete
+            self.make_product('html-book')
+            return real_delete(names)
+
+        with mock.patch.object(command, 'delete_unreferenced', side_effect=delete_after_reuse):
+            call_command(command, grace_minutes=-1)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(product.image.storage.exists(name))
+
+
+class FeedGenerationTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        feeds_root = self.settings(FEEDS_ROOT=tmp.name)
+        feeds_root.enable()
+        self.addCleanup(feeds_root.disable)
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(category=category, name='Laptop', slug='laptop',
+                                             price=Decimal('999.99'), stock=5)
+        Product.objects.create(category=category, name='Hidden', slug='hidden', price=Decimal('1.00'), available=False)
+
+    def test_generates_sitemap_and_feeds(self):
+        self.assertEqual(feeds.generate(), (1, 1))
+        response = self.client.get(reverse('shop:sitemap'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'sitemaps/products-0.xml', b''.join(response.streaming_content))
+        response = self.client.get(reverse('shop:sitemap_part', args=['products-0.xml']),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'/laptop/', gzip.decompress(b''.join(response.streaming_content)))
+        with open(os.path.join(self.root, 'products.csv')) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual([row[1] for row in rows], ['title', 'Laptop'])
+
+    def test_unchanged_shards_are_not_rewritten(self):
+        feeds.generate()
+        self.assertEqual(feeds.generate(), (0, 1))
+        self.laptop.price = Decimal('899.99')
+        self.laptop.save()
+        self.assertEqual(feeds.generate(), (1, 1))
+        with open(os.path.join(self.root, 'products.csv')) as f:
+            self.assertIn('899.99 GBP', f.read())
+
+
+class CatalogueSnapshotTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'catalogue.snapshot')
+        snapshot_settings = self.settings(CATALOGUE_SNAPSHOT_PATH=self.path, CATALOGUE_SNAPSHOT_CHECK_INTERVAL=0)
+        snapshot_settings.enable()
+        self.addCleanup(snapshot_settings.disable)
+        self.addCleanup(snapshot.reset)
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(category=self.category, name='Laptop', slug='laptop',
+                                             price=Decimal('999.99'), stock=5)
+        Product.objects.create(category=self.category, name='Café Table', slug='cafe-table',
+                               price=Decimal('49.50'), stock=0)
+        Product.objects.create(category=self.category, name='Hidden', slug='hidden', price=Decimal('1.00'),
+                               available=False)
+
+    def test_build_and_read(self):
+        snapshot.build(self.path)
+        snap = snapshot.get_snapshot()
+        self.assertEqual([c.slug for c in snap.categories()], ['electronics'])
+        self.assertEqual([p.name for p in snap.products()], ['Café Table', 'Laptop'])
+        self.assertEqual([p.name for p in snap.products(sort='-price')], ['Laptop', 'Café Table'])
+        self.assertEqual([p.name for p in snap.products(in_stock=True)], ['Laptop'])
+        self.assertEqual([p.name for p in snap.products(min_price=Decimal('50'))], ['Laptop'])
+        self.assertEqual([p.name for p in snap.products(category_ids=set())], [])
+        self.assertEqual([p.name for p in snap.products(max_price=Decimal('1000'), sort='price')],
+                         ['Café Table', 'Laptop'])
+        product = snap.product(self.laptop.id)
+        self.assertEqual((product.price, product.effective_price, product.stock), (Decimal('999.99'),) * 2 + (5,))
+        self.assertEqual(product.category.slug, 'electronics')
+        self.assertEqual(product.get_absolute_url(), self.laptop.get_absolute_url())
+        self.assertIsNone(snap.product(10 ** 9))
+
+    @override_settings(STREAM_PRODUCT_LIST=False)
+    def test_pages_served_from_snapshot(self):
+        snapshot.build(self.path)
+        # update() leaves `updated` alone, so the snapshot still counts as fresh
+        Product.objects.filter(id=self.laptop.id).update(name='Changed in the database')
+        response = self.client.get(reverse('shop:product_list_by_category', args=['electronics']) + '?sort=-price')
+        content = response.content.decode()
+        self.assertLess(content.index('Laptop'), content.index('Café Table'))
+        self.assertNotIn('Hidden', content)
+        self.assertNotIn('Changed in the database', content)
+        response = self.client.get(self.laptop.get_absolute_url())
+        self.assertIsInstance(response.context['product'], snapshot.SnapshotProduct)
+        self.assertContains(response, 'In Stock (5)')
+        self.assertNotContains(response, 'Changed in the database')
+        self.assertContains(response, '£999.99')
+        self.assertEqual(self.client.get(reverse('shop:product_detail', args=[self.laptop.id, 'wrong'])).status_code,
+                         404)
+        self.assertEqual(self.client.get(reverse('shop:product_list_by_category', args=['none'])).status_code, 404)
+
+    def test_indexed_filters_match_queryset(self):
+        books = Category.objects.create(name='Books', slug='books')
+        fiction = Category.objects.create(name='Fiction', slug='fiction', parent=books)
+        for n, (category, price) in enumerate([(books, '5.00'), (fiction, '12.00'), (fiction, '5.00'),
+                                               (books, '30.00'), (fiction, '49.50')]):
+            Product.objects.create(category=category, name=f'Book {n}', slug=f'book-{n}', price=Decimal(price),
+                                   stock=n % 2)
+        snapshot.build(self.path)
+        snap = snapshot.get_snapshot()
+        categories = list(Category.objects.all())
+        for category in (None, books, fiction, self.category):
+            ids = subtree_ids(categories, category) if category else None
+            for low, high in ((None, None), (Decimal('5'), Decimal('30')), (None, Decimal('12')),
+                              (Decimal('49.50'), None)):
+                for sort, ordering in SORT_ORDERING.items():
+                    queryset = Product.objects.filter(available=True).filter(price_filter(low, high))
+                    if ids is not None:
+                        queryset = queryset.filter(category_id__in=ids)
+                    expected = list(queryset.order_by(*ordering, 'id').values_list('name', flat=True))
+                    products = snap.products(ids, low, high, sort=sort)
+                    self.assertEqual([p.name for p in products], expected, (category, low, high, sort))
+
+    def test_build_skips_products_of_unknown_category(self):
+        books = Category.objects.create(name='Books', slug='books')
+        Product.objects.create(category=books, name='Novel', slug='novel', price=Decimal('8.00'))
+        # As if Books had been created between reading categories and products
+        categories = Category.objects.exclude(id=books.id).order_by('name', 'id')
+        with mock.patch.object(Category.objects, 'order_by', return_value=categories):
+            snapshot.build(self.path)
+        snap = snapshot.CatalogueSnapshot(self.path)
+        self.addCleanup(snap.close)
+        self.assertEqual([p.name for p in snap.products()], ['Café Table', 'Laptop'])
+
+    def test_stale_snapshot_falls_back_to_orm(self):
+        snapshot.build(self.path)
+        self.assertIsNotNone(snapshot.get_snapshot())
+        Product.objects.create(category=self.category, name='Mouse', slug='mouse', price=Decimal('5.00'))
+        self.assertIsNone(snapshot.get_snapshot())
+        self.assertIsInstance(snapshot.catalogue_categories()[0], Category)
+
+    def test_rebuild_is_picked_up(self):
+        snapshot.build(self.path)
+        first = snapshot.get_snapshot()
+        Category.objects.create(name='Books', slug='books')
+        snapshot.build(self.path)
+        self.assertIsNot(snapshot.get_snapshot(), first)
+        self.assertEqual(len(snapshot.get_snapshot().categories()), 2)
+
+
+class CompactCartTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(category=category, name='Laptop', slug='laptop',
+                                             price=Decimal('999.99'), stock=10)
+        self.mouse = Product.objects.create(category=category, name='Mouse', slug='mouse',
+                                            price=Decimal('19.50'), stock=10)
+
+    def add(self, product, quantity):
+        self.client.post(reverse('cart:cart_add', args=[product.id]), {'quantity': quantity})
+
+    def test_cart_stored_as_integers(self):
+        self.add(self.laptop, 1)
+        self.add(self.mouse, 2)
+        self.add(self.mouse, 1)
+        self.assertEqual(self.client.session['cart'], [self.laptop.id, 1, 99999, self.mouse.id, 3, 1950])
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.context['cart'].get_total_price(), Decimal('1058.49'))
+
+    def test_cart_page_renders_update_forms(self):
+        self.add(self.mouse, 2)
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertContains(response, 'name="quantity"')
+        self.assertContains(response, 'name="override"')
+        self.client.post(reverse('cart:cart_add', args=[self.mouse.id]), {'quantity': 5, 'override': True})
+        self.assertEqual(self.client.session['cart'], [self.mouse.id, 5, 1950])
+
+    def test_legacy_session_cart_is_read(self):
+        session = self.client.session
+        session['cart'] = {str(self.mouse.id): {'quantity': 2, 'price': '19.50'}}
+        session.save()
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['cart']), 2)
+        self.assertEqual(response.context['cart'].get_total_price(), Decimal('39.00'))
+
+    def test_checkout_revalidates_prices(self):
+        self.add(self.mouse, 2)
+        Product.objects.filter(id=self.mouse.id).update(price=Decimal('25.00'), effective_price=Decimal('25.00'))
+        data = {'first_name': 'John', 'last_name': 'Doe', 'email': 'john@example.com',
+                'address': '1 High St', 'postal_code': 'IP1 1AA', 'city': 'Ipswich'}
+        response = self.client.post(reverse('orders:order_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+        self.client.post(reverse('orders:order_create'), data)
+        self.assertEqual(Order.objects.get().total_price, Decimal('50.00'))
+
+
+class PromotionTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(category=self.category, name='Laptop', slug='laptop',
+                                             price=Decimal('1000.00'), stock=10)
+        self.mouse = Product.objects.create(category=self.category, name='Mouse', slug='mouse',
+                                            price=Decimal('20.00'), stock=10)
+        self.now = timezone.now()
+
+    def promote(self, **kwargs):
+        kwargs.setdefault('starts_at', self.now - timedelta(hours=1))
+        kwargs.setdefault('ends_at', self.now + timedelta(hours=1))
+        return Promotion.objects.create(name='Sale', **kwargs)
+
+    def prices(self):
+        return dict(Product.objects.values_list('slug', 'effective_price'))
+
+    def test_best_discount_wins(self):
+        self.promote(kind='percent', value=Decimal('10'), category=self.category)
+        self.promote(kind='fixed', value=Decimal('150'), product=self.laptop)
+        self.assertEqual(self.prices(), {'laptop': Decimal('850.00'), 'mouse': Decimal('18.00')})
+        self.assertTrue(Product.objects.get(slug='laptop').on_sale)
+
+    def test_expired_promotion_resets_price(self):
+        promotion = self.promote(kind='percent', value=Decimal('25'), product=self.mouse)
+        self.assertEqual(self.prices()['mouse'], Decimal('15.00'))
+        self.assertEqual(next_boundary(self.now), promotion.ends_at)
+        apply_promotions(now=promotion.ends_at)
+        self.assertEqual(self.prices()['mouse'], Decimal('20.00'))
+
+    def test_price_edit_reprices_product(self):
+        self.promote(kind='fixed', value=Decimal('5'), product=self.mouse)
+        self.mouse.refresh_from_db()
+        self.mouse.price = Decimal('30.00')
+        self.mouse.save()
+        self.assertEqual(self.prices()['mouse'], Decimal('25.00'))
+
+    def test_rerun_without_changes_touches_nothing(self):
+        self.promote(kind='percent', value=Decimal('10'), category=self.category)
+        stamps = dict(Product.objects.values_list('slug', 'updated'))
+        version = get_catalogue_version()
+        apply_promotions(now=self.now + timedelta(minutes=5))
+        self.assertEqual(dict(Product.objects.values_list('slug', 'updated')), stamps)
+        self.assertEqual(get_catalogue_version(), version)
+
+    def test_cart_and_filters_use_effective_price(self):
+        self.promote(kind='percent', value=Decimal('50'), product=self.laptop)
+        self.client.post(reverse('cart:cart_add', args=[self.laptop.id]), {'quantity': 1})
+        self.assertEqual(self.client.session['cart'], [self.laptop.id, 1, 50000])
+        response = self.client.get(reverse('shop:product_list'), {'max_price': '600'})
+        self.assertEqual([p.slug for p in response.context['products']], ['laptop', 'mouse'])
+
+
+class OrderHistoryTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.product = Product.objects.create(category=category, name='Mouse', slug='mouse', price=Decimal('20.00'))
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'secret')
+        self.orders = []
+        for i in range(5):
+            order = Order.objects.create(user=self.user, first_name='Alice', last_name='Smith',
+                                         email='alice@example.com', address='1 High St',
+                                         postal_code='IP1 1AA', city='Ipswich')
+            OrderItem.objects.create(order=order, product=self.product, price=Decimal('20.00'), quantity=i + 1)
+            self.orders.append(order)
+        # Equal timestamps must not drop or repeat orders across pages
+        Order.objects.filter(id__in=[o.id for o in self.orders[1:4]]).update(created_at=self.orders[1].created_at)
+
+    def test_keyset_pagination_in_constant_queries(self):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(2):
+                page, cursor = customer_orders(user=self.user, cursor=cursor, page_size=2)
+                seen += [(o.id, [i.product.name for i in o.items.all()]) for o in page]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(order_id for order_id, _ in seen), sorted(o.id for o in self.orders))
+
+    def test_migration_lowercases_existing_emails(self):
+        from django.apps import apps
+        migration = importlib.import_module('shop.migrations.0015_lowercase_order_emails')
+        Order.objects.filter(id=self.orders[0].id).update(email='Alice@Example.COM')
+        ArchivedOrder.objects.create(order_id=10 ** 6, created_at=timezone.now(), status='delivered',
+                                     email='Alice@Example.COM', total_price=Decimal('20.00'), data={})
+        migration.lowercase_emails(apps, None)
+        self.assertEqual(set(Order.objects.values_list('email', flat=True)), {'alice@example.com'})
+        self.assertEqual(ArchivedOrder.objects.get().email, 'alice@example.com')
+
+    def test_order_placed_requires_owner_or_token(self):
+        order = self.orders[0]
+        url = reverse('orders:order_placed', args=[order.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, {'token': order_token(self.orders[1])}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'token': order_token(order)}).status_code, 200)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_guest_history_by_emailed_link(self):
+        self.client.post(reverse('orders:order_lookup'), {'email': 'Alice@Example.com'})
+        jobs.run_pending('test-worker')
+        self.assertIn(history_token('alice@example.com'), mail.outbox[0].body)
+        response = self.client.get(reverse('orders:order_history'), {'token': history_token('alice@example.com')})
+        self.assertEqual(len(response.context['orders']), 5)
+        response = self.client.get(reverse('orders:order_history'), {'token': 'forged'})
+        self.assertRedirects(response, reverse('orders:order_lookup'))
+
+
+class WishlistTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(category=category, name='Laptop', slug='laptop',
+                                             price=Decimal('1000.00'), stock=10)
+        self.mouse = Product.objects.create(category=category, name='Mouse', slug='mouse',
+                                            price=Decimal('20.00'), stock=0)
+        self.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'secret') for i in range(3)]
+
+    def save(self, user, product):
+        WishlistItem.objects.create(user=user, product=product, notified_price=product.effective_price,
+                                    notified_in_stock=product.stock > 0)
+
+    def test_guest_wishlist_moves_to_account_on_login(self):
+        self.client.post(reverse('wishlist:wishlist_add', args=[self.laptop.id]))
+        self.client.post(reverse('wishlist:wishlist_add', args=[self.laptop.id]))
+        self.assertEqual(WishlistItem.objects.filter(user=None).count(), 1)
+        self.save(self.users[0], self.laptop)
+        self.client.login(username='user0', password='secret')
+        response = self.client.get(reverse('wishlist:wishlist_detail'))
+        self.assertEqual([item.product for item in response.context['items']], [self.laptop])
+        self.assertEqual(WishlistItem.objects.count(), 1)
+
+    def test_changes_are_batched_and_reported_once(self):
+        for user in self.users:
+            self.save(user, self.laptop)
+            self.save(user, self.mouse)
+        Product.objects.filter(id=self.laptop.id).update(effective_price=Decimal('900.00'))
+        Product.objects.filter(id=self.mouse.id).update(stock=5)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(notify_wishlists(batch_users=2), (3, 6))
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+        self.assertEqual(Job.objects.filter(name='wishlist.send_alerts').count(), 2)
+        jobs.run_pending('test-worker')
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('now £900.00 (was £1000.00)', mail.outbox[0].body)
+        self.assertIn('back in stock', mail.outbox[0].body)
+        self.assertEqual(notify_wishlists(), (0, 0))
+
+    def test_drop_during_run_is_reported_next_time(self):
+        self.save(self.users[0], self.laptop)
+        Product.objects.filter(id=self.laptop.id).update(effective_price=Decimal('900.00'))
+        real_flush = notifications._flush
+
+        def flush_after_second_drop(batch, rows):
+            Product.objects.filter(id=self.laptop.id).update(effective_price=Decimal('800.00'))
+            return real_flush(batch, rows)
+
+        with mock.patch.object(notifications, '_flush', side_effect=flush_after_second_drop):
+            self.assertEqual(notify_wishlists(), (1, 1))
+        self.assertEqual(WishlistItem.objects.get().notified_price, Decimal('900.00'))
+        self.assertEqual(notify_wishlists(), (1, 1))
+
+    def test_price_rise_moves_baseline_silently(self):
+        self.save(self.users[0], self.laptop)
+        guest = WishlistItem.objects.create(session_key='guest', product=self.laptop, notified_price=Decimal('1000.00'))
+        Product.objects.filter(id=self.laptop.id).update(effective_price=Decimal('1100.00'))
+        self.assertEqual(notify_wishlists(), (0, 0))
+        # Session wishlists keep their baseline until merged into an account
+        guest.refresh_from_db()
+        self.assertEqual(guest.notified_price, Decimal('1000.00'))
+        Product.objects.filter(id=self.laptop.id).update(effective_price=Decimal('1050.00'))
+        self.assertEqual(notify_wishlists(), (1, 1))
+
+
+class RateLimitTest(TestCase):
+    def setUp(self):
+        ratelimit.get_buckets().clear()
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.product = Product.objects.create(category=category, name='Mouse', slug='mouse',
+                                              price=Decimal('20.00'), stock=10)
+
+    def tearDown(self):
+        ratelimit.get_buckets().clear()
+
+    def add(self, client):
+        return client.post(reverse('cart:cart_add', args=[self.product.id]), {'quantity': 1})
+
+    @override_settings(RATE_LIMITS={'cart:cart_add': {'ip': '100/m', 'session': '2/m'}})
+    def test_session_bucket(self):
+        self.add(self.client)  # starts the session
+        self.assertEqual([self.add(self.client).status_code for _ in range(3)], [302, 302, 429])
+        self.assertEqual(self.add(self.client)['Retry-After'], '30')
+        self.assertEqual(self.client.get(reverse('cart:cart_detail')).status_code, 200)
+        self.assertEqual(self.add(Client()).status_code, 302)
+
+    @override_settings(RATE_LIMITS={'cart:cart_add': {'ip': '3/m'}})
+    def test_ip_bucket_spans_sessions(self):
+        statuses = [self.add(Client()).status_code for _ in range(4)]
+        self.assertEqual(statuses, [302, 302, 302, 429])
+
+    def test_token_bucket_refills(self):
+        buckets = ratelimit.MemoryBuckets()
+        self.assertEqual(buckets.take('k', 1, 1000), 0)
+        self.assertGreater(buckets.take('k', 1, 1000), 0)
+        time.sleep(0.002)
+        self.assertEqual(buckets.take('k', 1, 1000), 0)
+
+    def test_shared_in_flight_used_with_redis(self):
+        self.assertIs(ratelimit.get_in_flight(), ratelimit.in_flight)
+        with mock.patch.object(ratelimit, 'get_redis', return_value=mock.Mock()):
+            self.assertIsInstance(ratelimit.get_in_flight(), ratelimit.RedisInFlight)
+        ratelimit._shared_in_flight = None
+
+    @override_settings(LOAD_SHED_MAX_IN_FLIGHT=4, LOAD_SHED_BROWSE_FRACTION=0.5)
+    def test_load_shedding_prefers_checkout(self):
+        ratelimit.in_flight.count = 2
+        try:
+            self.assertEqual(self.client.get(reverse('shop:product_list')).status_code, 503)
+            self.assertEqual(self.client.get(reverse('cart:cart_detail')).status_code, 200)
+            ratelimit.in_flight.count = 4
+            self.assertEqual(self.client.get(reverse('cart:cart_detail')).status_code, 503)
+        finally:
+            ratelimit.in_flight.count = 0
+
+    @override_settings(LOAD_SHED_MAX_IN_FLIGHT=4, WARMUP_ON_START=False)
+    def test_health_checks_never_shed(self):
+        ratelimit.in_flight.count = 4
+        try:
+            self.assertEqual(self.client.get(reverse('readyz')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        finally:
+            ratelimit.in_flight.count = 0
+
+    @skipUnless(ratelimit.HAS_REDIS, 'redis is not installed')
+    def test_redis_outage_fails_open(self):
+        client = mock.Mock()
+        client.register_script.return_value.side_effect = ratelimit.redis.ConnectionError('down')
+        client.zrem.side_effect = ratelimit.redis.ConnectionError('down')
+        with self.assertLogs('shop.ratelimit', 'WARNING'):
+            self.assertEqual(ratelimit.RedisBuckets(client).take('k', 1, 1), 0)
+            tracker = ratelimit.RedisInFlight(client)
+            token = tracker.enter(1)
+            self.assertTrue(token)
+            tracker.leave(token)
+
+
+class WarmupTest(TestCase):
+    def setUp(self):
+        self.saved = dict(warmup.STATE, steps=dict(warmup.STATE['steps']))
+        warmup.STATE.update(ready=False, steps={})
+
+    def tearDown(self):
+        warmup.STATE.update(self.saved)
+
+    def test_readyz_passes_only_after_warm_up(self):
+        response = self.client.get(reverse('readyz'))
+        self.assertEqual(response.status_code, 503)
+        steps = warmup.warm_up()
+        self.assertEqual(set(steps), {'urls', 'templates', 'caches', 'databases', 'total'})
+        response = self.client.get(reverse('readyz'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ready'])
+
+    def test_readyz_fails_while_database_unreachable(self):
+        warmup.warm_up()
+        with mock.patch.object(connection, 'ensure_connection', side_effect=OperationalError('gone')):
+            self.assertFalse(warmup.is_ready())
+        self.assertTrue(warmup.is_ready())
+
+    def test_all_shop_templates_compile(self):
+        self.assertGreater(warmup.compile_templates(), 10)
+
+    @override_settings(WARMUP_ON_START=False)
+    def test_ready_when_warm_up_disabled(self):
+        self.assertEqual(self.client.get(reverse('readyz')).status_code, 200)
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.computers = Category.objects.create(name='Computers', slug='computers', parent=self.electronics)
+        self.laptops = Category.objects.create(name='Laptops', slug='laptops', parent=self.computers)
+        self.audio = Category.objects.create(name='Audio', slug='audio', parent=self.electronics)
+        self.books = Category.objects.create(name='Books', slug='books')
+        for category, name in [(self.laptops, 'ThinkPad'), (self.computers, 'Monitor'),
+                               (self.audio, 'Headphones'), (self.books, 'Clean Code')]:
+            Product.objects.create(category=category, name=name, slug=name.lower(), price=Decimal('10.00'))
+
+    def test_paths(self):
+        self.assertEqual(self.laptops.path, Category.path_segment(self.electronics.id)
+                         + Category.path_segment(self.computers.id) + Category.path_segment(self.laptops.id))
+        self.assertEqual(self.laptops.depth, 2)
+        self.assertEqual(self.laptops.ancestor_ids(), [self.electronics.id, self.computers.id])
+
+    def test_subtree_products_and_sidebar(self):
+        response = self.client.get(reverse('shop:product_list_by_category', args=['electronics']))
+        self.assertEqual(sorted(p.name for p in response.context['products']), ['Headphones', 'Monitor', 'ThinkPad'])
+        tree = response.context['categories']
+        self.assertEqual([(c.name, c.depth, c.product_count) for c in tree], [
+            ('Books', 0, 1), ('Electronics', 0, 3), ('Audio', 1, 1), ('Computers', 1, 2), ('Laptops', 2, 1),
+        ])
+        response = self.client.get(reverse('shop:product_list_by_category', args=['laptops']))
+        self.assertEqual([c.name for c in response.context['breadcrumbs']], ['Electronics', 'Computers'])
+
+    def test_move_subtree_in_one_update(self):
+        self.computers.parent = self.books
+        with self.assertNumQueries(3):
+            self.computers.save()
+        self.laptops.refresh_from_db()
+        self.assertEqual(self.laptops.ancestor_ids(), [self.books.id, self.computers.id])
+        names = [c.name for c in category_tree(list(Category.objects.all()))]
+        self.assertEqual(names, ['Books', 'Computers', 'Laptops', 'Electronics', 'Audio'])
+
+    def test_seed_catalogue_loads_fixture_once(self):
+        Category.objects.all().delete()
+        call_command('seed_catalogue', stdout=StringIO())
+        books = Category.objects.get(slug='books')
+        self.assertEqual(books.path, Category.path_segment(books.pk))
+        self.assertTrue(all(Category.objects.values_list('updated', flat=True)))
+        books.parent = Category.objects.get(slug='electronics')
+        books.save()
+        call_command('seed_catalogue', stdout=StringIO())
+        books.refresh_from_db()
+        self.assertEqual(books.parent.slug, 'electronics')
+        self.assertEqual(Category.rebuild_paths(), 0)
+
+    def test_rebuild_paths_after_raw_load(self):
+        Category.objects.filter(pk=self.laptops.pk).update(path='')
+        Category.objects.filter(pk=self.computers.pk).update(path=Category.path_segment(self.computers.pk))
+        self.assertEqual(Category.rebuild_paths(), 2)
+        self.laptops.refresh_from_db()
+        self.assertEqual(self.laptops.ancestor_ids(), [self.electronics.id, self.computers.id])
+
+    def test_cannot_move_under_own_subtree(self):
+        self.electronics.parent = self.laptops
+        with self.assertRaises(ValidationError):
+            self.electronics.save()
+
+
+class AssetBundleTest(TestCase):
+    def test_bundles_are_up_to_date(self):
+        self.assertEqual(bundles.build_bundles(check=True), [])
+
+    def test_minify_css(self):
+        css = '/* Nav */\n.a .b:hover,\n.c > .d {\n    color: #fff;\n    margin: 0 auto;\n}\n'
+        self.assertEqual(bundles.minify_css(css), '.a .b:hover,.c>.d{color:#fff;margin:0 auto}\n')
+
+    def test_critical_css_inlined_and_rest_preloaded(self):
+        content = self.client.get(reverse('shop:home')).content.decode()
+        self.assertIn('.top-navbar{', content)
+        # Cards are laid out by the inlined CSS, so they do not reflow when site.css arrives
+        self.assertIn('.product-card{', content)
+        self.assertNotIn('footer{', content)
+        self.assertIn('<link rel="preload" href="/static/shop/dist/site.css" as="style"', content)
+
+    @override_settings(ASSETS_INLINE_ALL=True)
+    def test_inline_all(self):
+        content = self.client.get(reverse('shop:home')).content.decode()
+        self.assertIn('footer{', content)
+        self.assertNotIn('rel="preload"', content)
+
+
+class StreamingListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Books', slug='books')
+        for i in range(5):
+            Product.objects.create(category=self.category, name=f'Book {i}', slug=f'book-{i}', price=Decimal('5.00'))
+
+    @override_settings(STREAM_PRODUCT_LIST=True, STREAM_CHUNK_SIZE=2)
+    def test_streams_shell_then_cards(self):
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 5)  # shell, three chunks of cards, rest of the page
+        self.assertIn('<nav', chunks[0])
+        self.assertNotIn('Book 0', chunks[0])
+        self.assertIn('Book 4', chunks[3])
+        self.assertIn('</html>', chunks[-1])
+        self.assertIn('csrftoken', response.cookies)
+
+    @override_settings(STREAM_PRODUCT_LIST=True)
+    def test_chunks_render_pinned_when_view_was(self):
+        pinned = []
+
+        def chunked(items, size):
+            pinned.append(routers.is_pinned())
+            return streaming_chunked(items, size)
+
+        session = self.client.session
+        session[PRIMARY_PIN_SESSION_KEY] = time.time() + 60
+        session.save()
+        with mock.patch('shop.streaming.chunked', side_effect=chunked):
+            b''.join(self.client.get(reverse('shop:product_list')).streaming_content)
+            b''.join(self.client.get(reverse('shop:product_list') + '?min_price=0').streaming_content)
+        self.assertEqual(pinned, [True, True])
+
+    @override_settings(STREAM_PRODUCT_LIST=True, LOAD_SHED_MAX_IN_FLIGHT=10)
+    def test_in_flight_until_stream_sent(self):
+        ratelimit.in_flight.count = 0
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertEqual(ratelimit.in_flight.count, 1)
+        b''.join(response.streaming_content)
+        self.assertEqual(ratelimit.in_flight.count, 0)
+
+    @override_settings(STREAM_PRODUCT_LIST=True)
+    def test_empty_list(self):
+        response = self.client.get(reverse('shop:product_list') + '?min_price=1000')
+        self.assertContains(response, 'No products found')
+
+    @override_settings(STREAM_PRODUCT_LIST=False)
+    def test_buffered(self):
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'Book 4')
+
+
+class IdempotentCheckoutTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.product = Product.objects.create(category=category, name='Mouse', slug='mouse',
+                                              price=Decimal('20.00'), stock=10)
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]), {'quantity': 2})
+        self.key = self.client.get(reverse('orders:order_create')).context['form']['idempotency_key'].value()
+        self.data = {'first_name': 'John', 'last_name': 'Doe', 'email': 'john@example.com',
+                     'address': '1 High St', 'postal_code': 'IP1 1AA', 'city': 'Ipswich',
+                     'idempotency_key': self.key}
+
+    def test_resubmission_returns_the_same_order(self):
+        first = self.client.post(reverse('orders:order_create'), self.data)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post(reverse('orders:order_create'), self.data)
+        # Same order; the signed token in the query string embeds a timestamp
+        self.assertEqual(urlsplit(second.url).path, urlsplit(first.url).path)
+        # Only the key lookup, besides loading and saving the session
+        shop_queries = [q['sql'] for q in queries if 'shop_' in q['sql']]
+        self.assertEqual(len(shop_queries), 1)
+        self.assertIn('idempotency_key', shop_queries[0])
+        order = Order.objects.get()
+        self.assertEqual(order.idempotency_key, self.key)
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual(Job.objects.filter(name='orders.send_confirmation').count(), 1)
+
+    def test_concurrent_duplicate_hits_unique_index(self):
+        first = self.client.post(reverse('orders:order_create'), self.data)
+        self.client.post(reverse('cart:cart_add', args=[self.product.id]), {'quantity': 2})
+        # The duplicate's early lookup ran before the first order committed
+        with mock.patch('shop.orders.views._order_for_key', side_effect=[None, Order.objects.get()]):
+            second = self.client.post(reverse('orders:order_create'), self.data)
+        # Same order; the signed token in the query string embeds a timestamp
+        self.assertEqual(urlsplit(second.url).path, urlsplit(first.url).path)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assertEqual(len(Cart(second.wsgi_request)), 0)
+
+    def test_new_form_gets_new_key(self):
+        response = self.client.get(reverse('orders:order_create'))
+        self.assertNotEqual(response.context['form']['idempotency_key'].value(), self.key)
+
+
+class PurgeSessionsTest(TestCase):
+    def make_session(self, cart=None, expired=True, wishlist=None):
+        store = SessionStore()
+        if cart is not None:
+            store['cart'] = cart
+        if wishlist is not None:
+            store['wishlist'] = wishlist
+        store.create()
+        if expired:
+            Session.objects.filter(session_key=store.session_key).update(
+                expire_date=timezone.now() - timedelta(days=1))
+        return store.session_key
+
+    def test_purges_in_batches_and_keeps_carts(self):
+        for _ in range(5):
+            self.make_session()
+        self.make_session([7, 2, 1999, 9, 1, 500])
+        self.make_session({'7': {'quantity': 3, 'price': '19.99'}})
+        live = self.make_session([7, 1, 1999], expired=False)
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, keep_carts=True, stdout=out)
+        self.assertIn('7 session(s) deleted, 2 abandoned cart(s)', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live])
+        carts = sorted(AbandonedCart.objects.values_list('items', 'total_price'))
+        self.assertEqual(carts, [([7, 2, 9, 1], Decimal('44.98')), ([7, 3], Decimal('59.97'))])
+
+    def test_deletes_expired_guest_wishlists(self):
+        product = Product.objects.create(category=Category.objects.create(name='Books', slug='books'),
+                                         name='Clean Code', slug='clean-code', price=Decimal('30.00'))
+        for key in ('expired', 'live'):
+            WishlistItem.objects.create(session_key=key, product=product, notified_price=product.price)
+        self.make_session(wishlist='expired')
+        self.make_session(wishlist='live', expired=False)
+        call_command('purge_sessions', stdout=StringIO())
+        self.assertEqual(list(WishlistItem.objects.values_list('session_key', flat=True)), ['live'])
+
+    def test_without_keep_carts(self):
+        self.make_session([7, 2, 1999])
+        call_command('purge_sessions', stdout=StringIO())
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(AbandonedCart.objects.exists())
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection in the pool tests."""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.info = type('Info', (), {'transaction_status': 0})()
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        if self.broken:
+            raise dbpool.OperationalError('server closed the connection unexpectedly')
+
+    def rollback(self):
+        self.info.transaction_status = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(TestCase):
+    def pool(self, **options):
+        return dbpool.ConnectionPool(FakeConnection, **options)
+
+    def test_connections_are_reused(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        conn.info.transaction_status = 2  # left in a transaction
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(conn.info.transaction_status, 0)
+        self.assertEqual(pool.snapshot()['opened'], 1)
+
+    def test_bounded_with_acquire_timeout(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(dbpool.PoolTimeout):
+            pool.acquire()
+        threading.Timer(0.02, pool.release, [conn]).start()
+        pool.timeout = 1
+        self.assertIs(pool.acquire(), conn)
+        stats = pool.snapshot()
+        self.assertEqual((stats['timeouts'], stats['waits'], stats['size']), (1, 2, 1))
+
+    def test_failed_health_check_drops_idle_connections(self):
+        pool = self.pool(check_after=0)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        first.broken = second.broken = True
+        conn = pool.acquire()
+        self.assertNotIn(conn, (first, second))
+        self.assertTrue(first.closed and second.closed)
+        stats = pool.snapshot()
+        self.assertEqual((stats['failed_checks'], stats['size'], stats['opened']), (1, 1, 3))
+
+    def test_max_lifetime(self):
+        pool = self.pool(max_lifetime=0)
+        conn = pool.acquire()
+        time.sleep(0.001)
+        pool.release(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.snapshot()['size'], 0)
+
+    @override_settings(DB_POOL=True)
+    def test_metrics(self):
+        for alias in ('metrics-test', 'metrics-replica'):
+            dbpool.get_pool(alias, {'POOL': {'MIN_SIZE': 2}}, FakeConnection)
+            self.addCleanup(dbpool._pools.pop, alias)
+        response = self.client.get(reverse('metrics'))
+        for alias in ('metrics-test', 'metrics-replica'):
+            self.assertContains(response, f'shop_db_pool_idle{{alias="{alias}"')
+            self.assertContains(response, f'shop_db_pool_opened_total{{alias="{alias}"')
+        type_lines = [line for line in response.content.decode().splitlines() if line.startswith('# TYPE')]
+        self.assertEqual(len(type_lines), len(set(type_lines)))
+        self.assertIn('# TYPE shop_db_pool_idle gauge', type_lines)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_access(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.9').status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.9',
+                                         HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.9',
+                                         HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'shop'
@@ -10,5 +10,8 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('blog/', views.blog, name='blog'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap'),
+    re_path(r'^sitemaps/(?P<name>(?:pages|products-\d+)\.xml)$', views.sitemap_part, name='sitemap_part'),
+    re_path(r'^feeds/products\.(?P<fmt>csv|xml)$', views.product_feed, name='product_feed'),
     path('<int:id>/<slug:slug>/', views.product_detail, name='product_detail'),
 ]
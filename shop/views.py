@@ -1,10 +1,24 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404
+from django.views.static import serve
 from .models import Category, Product
 from .cart.forms import CartAddProductForm
+from .catalogue import ancestors, category_tree, count_subtrees, facet_counts, price_filter, subtree_ids
+from .forms import ProductFilterForm, SORT_CHOICES, SORT_ORDERING
+from .profiling import FOLDED_SUFFIX, SPEEDSCOPE_SUFFIX, list_profiles
+from .snapshot import catalogue_categories, get_snapshot
+from .storage import is_blob
+from .streaming import stream_render
+from .warmup import STATE as WARMUP_STATE, is_ready
 
 
 def home(request):
-    categories = Category.objects.all()
+    categories = category_tree(catalogue_categories())
     products = Product.objects.filter(available=True)
     return render(request, 'shop/product/index.html', {
         'categories': categories,
@@ -12,27 +26,90 @@ def home(request):
     })
 
 
+def _query_string(params, **changes):
+    params = params.copy()
+    for key, value in changes.items():
+        if value is None:
+            params.pop(key, None)
+        else:
+            params[key] = value
+    return '?' + params.urlencode() if params else ''
+
+
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
+    # Cards come from the shared snapshot while it is fresh, else the database
+    snapshot = get_snapshot()
+    categories = category_tree(catalogue_categories())
     products = Product.objects.filter(available=True)
 
-    if category_slug:
+    if category_slug and snapshot is not None:
+        category = next((c for c in categories if c.slug == category_slug), None)
+        if category is None:
+            raise Http404('No Category matches the given query.')
+    elif category_slug:
         category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+        # Sub-categories included: one range scan on the category path index
+        products = products.filter(category__path__startswith=category.path)
+
+    filter_form = ProductFilterForm(request.GET)
+    # Invalid fields are left out of cleaned_data; the valid ones still apply
+    filter_form.is_valid()
+    filters = filter_form.cleaned_data
+    min_price = filters.get('min_price')
+    max_price = filters.get('max_price')
+    in_stock = filters.get('in_stock', False)
+    sort = filters.get('sort') or 'name'
 
-    return render(request, 'shop/product/list.html', {
+    if snapshot is not None:
+        products = snapshot.products(subtree_ids(categories, category) if category else None, min_price, max_price,
+                                     in_stock, sort, categories={c.id: c for c in categories})
+    else:
+        if in_stock:
+            products = products.filter(stock__gt=0)
+        products = products.filter(price_filter(min_price, max_price)).order_by(*SORT_ORDERING[sort])
+
+    facets = facet_counts(subtree_ids(categories, category) if category else None, min_price, max_price, in_stock)
+    count_subtrees(categories, facets['categories'])
+    params = request.GET.copy()
+    for bucket in facets['price_buckets']:
+        bucket['active'] = bucket['min'] == min_price and bucket['max'] == max_price
+        bucket['query'] = _query_string(params, min_price=None, max_price=None) if bucket['active'] else \
+            _query_string(params, min_price=str(bucket['min']), max_price=str(bucket['max']) if bucket['max'] else None)
+
+    context = {
         'category': category,
         'categories': categories,
+        'breadcrumbs': ancestors(categories, category) if category else [],
         'products': products,
-    })
+        'facets': facets,
+        'filter_form': filter_form,
+        'in_stock': in_stock,
+        'sort': sort,
+        'sort_choices': SORT_CHOICES,
+        'query_string': _query_string(params),
+        'in_stock_query': _query_string(params, in_stock=None if in_stock else '1'),
+    }
+    if settings.STREAM_PRODUCT_LIST:
+        items = products if snapshot is not None else products.iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+        return stream_render(request, 'shop/product/list.html', context, 'shop/product/_cards.html', 'products',
+                             items, settings.STREAM_CHUNK_SIZE)
+    return render(request, 'shop/product/list.html', context)
 
 
 def product_detail(request, id, slug):
-    product = get_object_or_404(Product, id=id, slug=slug, available=True)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        # The snapshot holds available products only
+        product = snapshot.product(id)
+        if product is None or product.slug != slug:
+            raise Http404('No Product matches the given query.')
+    else:
+        product = get_object_or_404(Product.objects.select_related('category'), id=id, slug=slug, available=True)
     cart_product_form = CartAddProductForm()
     return render(request, 'shop/product/detail.html', {
         'product': product,
+        'breadcrumbs': ancestors(catalogue_categories(), product.category),
         'cart_product_form': cart_product_form,
     })
 
@@ -47,3 +124,92 @@ def contact(request):
 
 def blog(request):
     return render(request, 'shop/pages/content/blog.html')
+
+
+@staff_member_required
+def profile_list(request):
+    profiles = [
+        {'name': path.name, 'folded': path.name[:-len(SPEEDSCOPE_SUFFIX)] + FOLDED_SUFFIX,
+         'size': path.stat().st_size}
+        for path in list_profiles()
+    ]
+    return render(request, 'admin/profiles.html', {'title': 'Request profiles', 'profiles': profiles})
+
+
+@staff_member_required
+def profile_download(request, name):
+    for path in list_profiles():
+        if name in (path.name, path.name[:-len(SPEEDSCOPE_SUFFIX)] + FOLDED_SUFFIX):
+            return FileResponse(open(path.with_name(name), 'rb'), as_attachment=True, filename=name)
+    raise Http404('Profile not found')
+
+
+def serve_media(request, path, document_root=None):
+    response = serve(request, path, document_root=document_root)
+    if is_blob(path):
+        # Blob names are content hashes, so the file behind a URL never changes
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def _serve_feed_file(request, relative_path, content_type):
+    path = os.path.join(settings.FEEDS_ROOT, relative_path)
+    gzipped = path + '.gz'
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and os.path.exists(gzipped):
+        response = FileResponse(open(gzipped, 'rb'), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    elif os.path.exists(path):
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        raise Http404('Feed has not been generated yet')
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+
+def sitemap_index(request):
+    return _serve_feed_file(request, 'sitemap.xml', 'application/xml')
+
+
+def sitemap_part(request, name):
+    return _serve_feed_file(request, os.path.join('sitemaps', name), 'application/xml')
+
+
+def product_feed(request, fmt):
+    content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/xml'
+    return _serve_feed_file(request, f'products.{fmt}', content_type)
+
+
+def readyz(request):
+    """Readiness probe: 200 once warmed up and while this worker reaches its databases (see shop.warmup)."""
+    ready = is_ready()
+    return JsonResponse({'ready': ready, 'warmup_ms': WARMUP_STATE['steps']}, status=200 if ready else 503)
+
+
+POOL_GAUGES = ['size', 'idle', 'in_use', 'waiting', 'max_size']
+
+
+def metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """Prometheus metrics for this worker process: database pool usage (with DB_POOL)."""
+    if not metrics_allowed(request):
+        return HttpResponse(status=403)
+    lines = []
+    if settings.DB_POOL:
+        from .dbpool import pool_stats
+        pools = pool_stats()
+        names = next(iter(pools.values()), {})
+        # One TYPE line per metric, then a sample per pool: Prometheus rejects repeats
+        for name in names:
+            kind = 'gauge' if name in POOL_GAUGES else 'counter'
+            metric = f'shop_db_pool_{name}' if kind == 'gauge' else f'shop_db_pool_{name}_total'
+            lines.append(f'# TYPE {metric} {kind}')
+            for alias, stats in pools.items():
+                lines.append(f'{metric}{{alias="{alias}",pid="{os.getpid()}"}} {stats[name]}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
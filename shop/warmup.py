@@ -0,0 +1,123 @@
+"""
+Process warm-up, so the first customer request after a deploy is not the
+one that pays for lazy initialisation.
+
+wsgi.py calls warm_up() once the WSGI handler exists. It resolves and
+populates the URLconf (importing every view module on the way), compiles
+every template under shop/templates into the cached loader, primes the
+catalogue caches and snapshot mapping, and opens a connection to each
+database. Each step is timed; /readyz returns 503 until all have run, and
+afterwards whenever this worker cannot reach its databases (checked live on
+every probe, since the master's warm-up says nothing about a worker's own
+connections).
+
+With gunicorn's preload_app (see gunicorn.conf.py) this runs once in the
+master and workers inherit the warmed state when they fork. Database
+connections cannot be shared across a fork, so the master closes them
+before forking and each worker reopens its own in post_fork via
+connect_databases(). Connections are per thread, so this helps sync
+workers; gthread workers still connect on each thread's first request.
+"""
+
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+STATE = {'ready': False, 'steps': {}}
+
+
+def populate_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict  # populating imports every view module
+    namespaces = list(resolver.namespace_dict.values())
+    while namespaces:
+        _, namespace_resolver = namespaces.pop()
+        namespace_resolver.reverse_dict
+        namespaces += namespace_resolver.namespace_dict.values()
+    return len(resolver.reverse_dict)
+
+
+def compile_templates():
+    engine = engines['django']
+    root = Path(apps.get_app_config('shop').path) / 'templates'
+    compiled = 0
+    for path in sorted(root.rglob('*.html')):
+        name = path.relative_to(root).as_posix()
+        try:
+            engine.get_template(name)
+            compiled += 1
+        except Exception:
+            logger.exception('Warm-up could not compile template %s', name)
+    return compiled
+
+
+def prime_caches():
+    from .catalogue import facet_counts, get_catalogue_version
+    from .snapshot import catalogue_categories
+    get_catalogue_version()
+    facet_counts()
+    return len(catalogue_categories())
+
+
+def connect_databases():
+    """Open a connection to every configured database in this process/thread."""
+    started = time.perf_counter()
+    for connection in connections.all():
+        connection.ensure_connection()
+    STATE['steps']['databases'] = round((time.perf_counter() - started) * 1000, 1)
+
+
+STEPS = [
+    ('urls', populate_urls),
+    ('templates', compile_templates),
+    ('caches', prime_caches),
+]
+
+
+def warm_up():
+    """Run every warm-up step, recording how long each took (ms) in STATE."""
+    started = time.perf_counter()
+    for name, step in STEPS:
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            # A cold cache or a missing table must not stop the app starting
+            logger.exception('Warm-up step %s failed', name)
+        STATE['steps'][name] = round((time.perf_counter() - step_started) * 1000, 1)
+    try:
+        connect_databases()
+    except Exception:
+        logger.exception('Warm-up could not connect to the database')
+    STATE['ready'] = True
+    STATE['steps']['total'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info('Warm-up finished: %s', STATE['steps'])
+    return STATE['steps']
+
+
+def databases_reachable():
+    """Whether this thread can use every database, reconnecting if a connection has died."""
+    for connection in connections.all():
+        try:
+            connection.ensure_connection()
+            if not connection.is_usable():
+                connection.close()
+                connection.ensure_connection()
+        except Exception:
+            logger.warning('Readiness check could not reach database %s', connection.alias, exc_info=True)
+            return False
+    return True
+
+
+def is_ready():
+    if not settings.WARMUP_ON_START:
+        return True
+    return STATE['ready'] and databases_reachable()
@@ -0,0 +1 @@
+# WishlistItem is defined in shop/models.py
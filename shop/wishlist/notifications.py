@@ -0,0 +1,99 @@
+"""
+Price-drop and back-in-stock alerts for wishlists (see `manage.py notify_wishlists`).
+
+Each run finds every wishlist row whose product is now cheaper than, or back
+in stock since, what its owner was last told about, in a single join across
+all wishlists ordered by user. Rows are grouped per user and queued as
+wishlist.send_alerts jobs of up to `batch_users` users each; the same
+transaction moves the rows' baseline to the price and stock that were read
+and reported, so a change is reported once and a further change made while
+the run is in progress is reported next time. Price rises and sell-outs are not reported, but
+their baseline is moved too, so a later drop is measured from the new price.
+
+Anonymous (session) wishlists have no address to notify; they keep their
+baseline until they are merged into an account.
+"""
+
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Case, DecimalField, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.urls import reverse
+
+from shop.jobs import enqueue
+from shop.models import Product, WishlistItem
+
+BATCH_USERS = 200
+
+
+def pending_alerts():
+    return (
+        WishlistItem.objects.filter(user__isnull=False, product__available=True)
+        .exclude(user__email='')
+        .filter(Q(product__effective_price__lt=F('notified_price')) | Q(notified_in_stock=False, product__stock__gt=0))
+        .order_by('user_id', 'id')
+        .values('id', 'user_id', 'user__email', 'product_id', 'product__slug', 'product__name',
+                'product__effective_price', 'product__stock', 'notified_price', 'notified_in_stock')
+    )
+
+
+def _rebaseline(items):
+    """Set the baseline of `items` to each product's current price and stock, in one UPDATE."""
+    product = Product.objects.filter(pk=OuterRef('product_id')).order_by()
+    return items.update(
+        notified_price=Subquery(product.values('effective_price')[:1]),
+        notified_in_stock=Exists(product.filter(stock__gt=0)),
+    )
+
+
+def _rebaseline_to_read(rows):
+    """Set the baseline of the rows' items to the price and stock read with them, in one UPDATE."""
+    products = {row['product_id']: (row['product__effective_price'], row['product__stock'] > 0) for row in rows}
+    return WishlistItem.objects.filter(id__in=[row['id'] for row in rows]).update(
+        notified_price=Case(*[When(product_id=pid, then=Value(price)) for pid, (price, _) in products.items()],
+                            output_field=DecimalField(max_digits=10, decimal_places=2)),
+        notified_in_stock=Case(*[When(product_id=pid, then=Value(in_stock))
+                                 for pid, (_, in_stock) in products.items()],
+                               output_field=BooleanField()),
+    )
+
+
+def _alert(row):
+    return {
+        'name': row['product__name'],
+        'url': settings.SITE_URL.rstrip('/') + reverse('shop:product_detail',
+                                                       args=[row['product_id'], row['product__slug']]),
+        'price': str(row['product__effective_price']),
+        'old_price': str(row['notified_price']),
+        'price_drop': row['product__effective_price'] < row['notified_price'],
+        'restocked': not row['notified_in_stock'] and row['product__stock'] > 0,
+    }
+
+
+def _flush(batch, rows):
+    with transaction.atomic():
+        enqueue('wishlist.send_alerts', alerts=batch)
+        _rebaseline_to_read(rows)
+
+
+def notify_wishlists(batch_users=BATCH_USERS):
+    """Queue alerts for every changed wishlist item; returns (users, items) notified."""
+    users = items = 0
+    batch, batch_rows = [], []
+    for (user_id, email), rows in groupby(pending_alerts().iterator(chunk_size=2000),
+                                          key=lambda row: (row['user_id'], row['user__email'])):
+        rows = list(rows)
+        batch.append({'email': email, 'items': [_alert(row) for row in rows]})
+        batch_rows += rows
+        users += 1
+        items += len(rows)
+        if len(batch) >= batch_users:
+            _flush(batch, batch_rows)
+            batch, batch_rows = [], []
+    if batch:
+        _flush(batch, batch_rows)
+    _rebaseline(WishlistItem.objects.filter(user__isnull=False).filter(
+        Q(product__effective_price__gt=F('notified_price')) | Q(notified_in_stock=True, product__stock=0)
+    ))
+    return users, items
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.mail import send_mass_mail
+
+from shop.jobs import job
+
+
+def _line(item):
+    if item['price_drop']:
+        line = f"{item['name']}: now £{item['price']} (was £{item['old_price']})"
+    else:
+        line = f"{item['name']}: £{item['price']}"
+    if item['restocked']:
+        line += ' - back in stock'
+    return f"{line}\n{item['url']}"
+
+
+@job('wishlist.send_alerts')
+def send_alerts(alerts):
+    send_mass_mail([
+        (
+            'Ipswich Retail - Good news about your wishlist',
+            'Items on your wishlist have changed:\n\n' + '\n\n'.join(_line(item) for item in alert['items']),
+            settings.DEFAULT_FROM_EMAIL,
+            [alert['email']],
+        )
+        for alert in alerts
+    ])
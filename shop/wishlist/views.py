@@ -0,0 +1,22 @@
+from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_POST
+from shop.models import Product
+from .wishlist import Wishlist
+
+
+@require_POST
+def wishlist_add(request, product_id):
+    product = get_object_or_404(Product, id=product_id, available=True)
+    Wishlist(request).add(product)
+    return redirect('wishlist:wishlist_detail')
+
+
+@require_POST
+def wishlist_remove(request, product_id):
+    product = get_object_or_404(Product, id=product_id)
+    Wishlist(request).remove(product)
+    return redirect('wishlist:wishlist_detail')
+
+
+def wishlist_detail(request):
+    return render(request, 'shop/wishlist/detail.html', {'items': Wishlist(request).items()})
@@ -0,0 +1,59 @@
+import secrets
+
+from django.conf import settings
+from shop.models import WishlistItem
+
+
+class Wishlist(object):
+    """
+    Wishlist stored in the WishlistItem table. Logged-in users own their
+    rows directly; anonymous visitors get a random key in their session,
+    and their rows move to their account when they log in.
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        self.user = request.user if request.user.is_authenticated else None
+
+    def _owner(self, create=False):
+        if self.user is not None:
+            return {'user': self.user}
+        key = self.session.get(settings.WISHLIST_SESSION_ID)
+        if key is None and create:
+            key = self.session[settings.WISHLIST_SESSION_ID] = secrets.token_hex(16)
+        return {'user': None, 'session_key': key} if key else None
+
+    def items(self):
+        owner = self._owner()
+        if owner is None:
+            return WishlistItem.objects.none()
+        return WishlistItem.objects.filter(**owner).select_related('product')
+
+    def add(self, product):
+        WishlistItem.objects.get_or_create(product=product, **self._owner(create=True), defaults={
+            'notified_price': product.effective_price,
+            'notified_in_stock': product.stock > 0,
+        })
+
+    def remove(self, product):
+        self.items().filter(product=product).delete()
+
+    def __contains__(self, product):
+        return self.items().filter(product=product).exists()
+
+    def __len__(self):
+        return self.items().count()
+
+
+def merge_session_wishlist(sender, request, user, **kwargs):
+    """user_logged_in receiver: move the visitor's session wishlist to their account."""
+    key = request.session.pop(settings.WISHLIST_SESSION_ID, None)
+    if not key:
+        return
+    guest_items = WishlistItem.objects.filter(user=None, session_key=key)
+    WishlistItem.objects.bulk_create([
+        WishlistItem(user=user, product_id=item.product_id, notified_price=item.notified_price,
+                     notified_in_stock=item.notified_in_stock)
+        for item in guest_items
+    ], ignore_conflicts=True)
+    guest_items.delete()
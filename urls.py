@@ -1,13 +1,18 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
-from django.views.static import serve
+from shop import views as shop_views
 
 urlpatterns = [
+    path('readyz', shop_views.readyz, name='readyz'),
+    path('metrics', shop_views.metrics, name='metrics'),
+    path('admin/profiles/', shop_views.profile_list, name='profile_list'),
+    path('admin/profiles/<str:name>', shop_views.profile_download, name='profile_download'),
     path('admin/', admin.site.urls),
     path('', include('shop.urls', namespace='shop')),
     path('cart/', include('shop.cart.urls', namespace='cart')),
     path('orders/', include('shop.orders.urls', namespace='orders')),
+    path('wishlist/', include('shop.wishlist.urls', namespace='wishlist')),
     # Serve media files in both dev and production (DEBUG-independent)
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', shop_views.serve_media, {'document_root': settings.MEDIA_ROOT}),
 ]